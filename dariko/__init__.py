@@ -1,8 +1,11 @@
 # file generated by setuptools-scm
 # don't change, don't track in version control
 
-from dariko.config import set_config
+from dariko.config import config_context, set_config
 from dariko.driver import ask, ask_batch, ValidationError
+from dariko.client import Client
+from dariko.budget import budget_report
+from dariko.exceptions import DeadlineExceededError
 
 __version__ = "0.2.2"
 __version_tuple__ = (0, 2, 2)
@@ -11,9 +14,13 @@ version_tuple = __version_tuple__
 
 __all__ = [
     "set_config",
+    "config_context",
     "ask",
     "ask_batch",
+    "Client",
+    "budget_report",
     "ValidationError",
+    "DeadlineExceededError",
     "__version__",
     "__version_tuple__",
     "version",
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from .models.llm import Completion
+from .packing import estimate_tokens
+
+# 見積もりに掛ける安全係数
+DEFAULT_MARGIN = 1.5
+
+# 応答の前後に付く空白などの固定分と、1リクエストあたりの予算の上限
+_BASE_TOKENS = 16
+_MAX_BUDGET = 4096
+
+# パック時の1件あたりの出力の固定分（{"id": ..., "output": ...} と区切り文字）
+_PACKED_ITEM_TOKENS = 12
+
+# 再帰的なモデルを展開する深さの上限
+_MAX_DEPTH = 8
+
+
+def estimate_output_tokens(schema: Dict[str, Any], margin: float = DEFAULT_MARGIN) -> Optional[int]:
+    """
+    出力モデルの JSON Schema から、出力に必要なトークン数の上限を見積もる。
+
+    フィールド数・文字列の maxLength・配列の maxItems を使い、文字列は最悪ケース（1文字 = 1トークン）で数える。
+    長さ制約のない文字列・配列・任意の値を含む場合は上限を決められないため None を返し、
+    モデルごとの既定値に任せる（自由記述のフィールドを打ち切らないため）。
+
+    Args:
+        schema: 出力モデルの JSON Schema
+        margin: 見積もりに掛ける安全係数
+    """
+    defs = {**schema.get("definitions", {}), **schema.get("$defs", {})}
+    tokens = _estimate(schema, defs, 0)
+    if tokens is None:
+        return None
+    return min(int(tokens * margin) + _BASE_TOKENS, _MAX_BUDGET)
+
+
+def estimate_packed_output_tokens(item_tokens: Optional[int], count: int) -> int:
+    """
+    1件あたりの出力トークン予算 item_tokens から、count 件をまとめた応答の予算を求める。
+    item_tokens が None（上限を見積もれない）の場合は1リクエストあたりの上限を返す。
+    """
+    if item_tokens is None:
+        return _MAX_BUDGET
+    return (item_tokens + _PACKED_ITEM_TOKENS) * count + _BASE_TOKENS
+
+
+def max_pack_size(item_tokens: Optional[int]) -> Optional[int]:
+    """
+    まとめた応答の予算が1リクエストあたりの上限に収まる最大の件数を返す（最低1件）。
+    item_tokens が None の場合は制限しない（None を返す）。
+    """
+    if item_tokens is None:
+        return None
+    return max(1, (_MAX_BUDGET - _BASE_TOKENS) // (item_tokens + _PACKED_ITEM_TOKENS))
+
+
+def _estimate(schema: Any, defs: Dict[str, Any], depth: int) -> Optional[int]:
+    """schema に一致する値のトークン数の上限を返す。上限がない場合は None"""
+    if schema is True or not isinstance(schema, dict) or not schema:
+        return None
+    if depth > _MAX_DEPTH:
+        # 再帰的なモデルは深さに上限がない
+        return None
+    while "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+        depth += 1
+
+    if "const" in schema:
+        return estimate_tokens(json.dumps(schema["const"], ensure_ascii=False))
+    if "enum" in schema:
+        return max(estimate_tokens(json.dumps(v, ensure_ascii=False)) for v in schema["enum"])
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            return _max_or_none(_estimate(option, defs, depth + 1) for option in schema[key])
+    if "allOf" in schema:
+        return _estimate(schema["allOf"][0], defs, depth + 1)
+
+    types = schema.get("type")
+    if types is None:
+        return None
+    if isinstance(types, str):
+        types = [types]
+    return _max_or_none(_estimate_type(t, schema, defs, depth) for t in types)
+
+
+def _estimate_type(t: str, schema: Dict[str, Any], defs: Dict[str, Any], depth: int) -> Optional[int]:
+    if t == "object":
+        properties = schema.get("properties", {})
+        tokens = 2
+        for name, value in properties.items():
+            value_tokens = _estimate(value, defs, depth + 1)
+            if value_tokens is None:
+                return None
+            # キー・コロン・カンマ
+            tokens += estimate_tokens(json.dumps(name, ensure_ascii=False)) + 2 + value_tokens
+        if schema.get("additionalProperties", not properties):
+            # 任意のキーは数も長さも決められない
+            return None
+        return tokens
+    if t == "array":
+        if "maxItems" not in schema:
+            return None
+        item_tokens = _estimate(schema.get("items", {}), defs, depth + 1)
+        if item_tokens is None:
+            return None
+        return 2 + schema["maxItems"] * (item_tokens + 1)
+    if t == "string":
+        if "maxLength" not in schema:
+            return None
+        return schema["maxLength"] + 2
+    if t == "integer":
+        return 6
+    if t == "number":
+        return 8
+    return 2  # boolean / null
+
+
+def _max_or_none(values: Iterable[Optional[int]]) -> Optional[int]:
+    values = list(values)
+    if any(v is None for v in values):
+        return None
+    return max(values)
+
+
+class BudgetStats:
+    """出力トークン予算に対する実際の出力量を集計する"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model_name: str, budget: int, completion: Completion) -> None:
+        """
+        1回の呼び出しを記録する。
+
+        予算への到達はモデルが報告した打ち切り（finish_reason など）で判定し、
+        出力トークン数はモデルが報告した値を使う。報告がない場合のみ estimate_tokens による概算で、
+        予算以上であれば予算に達したとみなす。
+        """
+        used = completion.output_tokens
+        if used is None:
+            used = estimate_tokens(completion.text)
+        truncated = completion.truncated
+        if truncated is None:
+            truncated = used >= budget
+        with self._lock:
+            stats = self._models.setdefault(model_name, {"calls": 0, "hits": 0, "budget_tokens": 0, "used_tokens": 0})
+            stats["calls"] += 1
+            stats["hits"] += truncated
+            stats["budget_tokens"] += budget
+            stats["used_tokens"] += used
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        モデルごとの集計を返す。
+
+        Returns:
+            {モデル名: {"calls", "hits", "hit_rate", "mean_budget", "mean_used", "utilization"}}
+        """
+        with self._lock:
+            models = {name: dict(stats) for name, stats in self._models.items()}
+        report: Dict[str, Dict[str, float]] = {}
+        for name, stats in models.items():
+            calls = stats["calls"]
+            report[name] = {
+                "calls": calls,
+                "hits": stats["hits"],
+                "hit_rate": stats["hits"] / calls,
+                "mean_budget": stats["budget_tokens"] / calls,
+                "mean_used": stats["used_tokens"] / calls,
+                "utilization": stats["used_tokens"] / stats["budget_tokens"],
+            }
+        return report
+
+    def reset(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+# グローバルな ask / ask_batch の集計
+BUDGET_STATS = BudgetStats()
+
+
+def budget_report() -> Dict[str, Dict[str, float]]:
+    """グローバルな ask / ask_batch の出力トークン予算の到達率をモデルごとに返す"""
+    return BUDGET_STATS.report()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Type
+
+from .budget import BudgetStats
+from .deadline import Deadline
+from .driver import DEFAULT_PACK_TOKEN_BUDGET, _ask_batch_llm, _ask_llm, _create_llm, _resolve_model
+from .models.llm import LLM
+
+
+class Client:
+    """
+    設定・LLMインスタンス・スレッドプールを個別に保持するクライアント。
+
+    グローバル設定（set_config）に依存しないため、異なるモデルを使う複数のクライアントを
+    同一プロセス内でロックなしに並行して利用できる。
+
+    Example:
+        with Client("gpt-4o-mini", llm_key=key, max_workers=4) as client:
+            people = client.ask_batch(prompts, output_model=Person)
+    """
+
+    def __init__(self, model: str, llm_key: str | None = None, *, max_workers: int = 1, **options: Any):
+        """
+        Args:
+            model: 使用するLLMモデル名
+            llm_key: APIキーまたはトークン（オプション）
+            max_workers: ask_batch で同時に実行するリクエスト数
+            **options: モデル固有のオプション（LLMクラスのコンストラクタに渡される）
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.model = model
+        self.llm_key = llm_key
+        self.max_workers = max_workers
+        self.options = dict(options)
+        self.budget_stats = BudgetStats()
+        self._llm: LLM | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self) -> LLM:
+        """このクライアント専用のLLMインスタンス（初回アクセス時に生成）"""
+        with self._lock:
+            if self._llm is None:
+                self._llm = _create_llm(self.model, self.llm_key, self.options)
+            return self._llm
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dariko")
+            return self._executor
+
+    def ask(
+        self,
+        prompt: str,
+        *,
+        output_model: Type[Any] | None = None,
+        max_tokens: int | None = None,
+        deadline: float | None = None,
+    ) -> Any:
+        """
+        単一プロンプトを実行し、Pydantic 検証済みオブジェクトを返す。
+        max_tokens / deadline は dariko.ask と同じ。
+        """
+        pyd_model = _resolve_model(output_model)
+        return _ask_llm(
+            self.llm, prompt, pyd_model, max_tokens=max_tokens, stats=self.budget_stats, deadline=Deadline(deadline)
+        )
+
+    def ask_batch(
+        self,
+        prompts: List[str],
+        *,
+        output_model: Type[Any] | None = None,
+        pack_size: int | None = None,
+        pack_token_budget: int = DEFAULT_PACK_TOKEN_BUDGET,
+        max_tokens: int | None = None,
+        deadline: float | None = None,
+    ) -> List[Any]:
+        """
+        複数プロンプトをバッチ処理し、検証済みオブジェクトをリストで返す。
+        max_workers が 2 以上の場合はスレッドプールで並行に実行する。
+        pack_size / pack_token_budget / max_tokens / deadline は dariko.ask_batch と同じ。
+        締め切りを過ぎた場合、スレッドプール上の未着手の処理は取り消される。
+        """
+        pyd_model = _resolve_model(output_model)
+        executor = None if self.max_workers == 1 else self._get_executor()
+        return _ask_batch_llm(
+            self.llm,
+            prompts,
+            pyd_model,
+            pack_size=pack_size,
+            pack_token_budget=pack_token_budget,
+            max_tokens=max_tokens,
+            stats=self.budget_stats,
+            deadline=Deadline(deadline),
+            executor=executor,
+        )
+
+    def budget_report(self) -> Dict[str, Dict[str, float]]:
+        """このクライアントの出力トークン予算の到達率をモデルごとに返す"""
+        return self.budget_stats.report()
+
+    def close(self) -> None:
+        """スレッドプールを停止する"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self) -> Client:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -1,5 +1,8 @@
 import os
-from typing import Optional
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 from dotenv import load_dotenv
 
@@ -9,26 +12,70 @@ load_dotenv()
 # グローバル設定
 _MODEL: str = "gpt-4o-mini"
 _LLM_KEY: Optional[str] = None
+_OPTIONS: Dict[str, Any] = {}
+_LOCK = threading.Lock()
 
+# config_context で上書きされたコンテキストローカルな設定（モデル名, LLMキー, オプション）
+_CONTEXT_CONFIG: ContextVar[Optional[Tuple[str, Optional[str], Dict[str, Any]]]] = ContextVar(
+    "dariko_config", default=None
+)
 
-def set_config(model: str, llm_key: Optional[str] = None) -> None:
+
+def set_config(model: str, llm_key: Optional[str] = None, **options: Any) -> None:
     """
     モデルとLLMキー（APIキーまたはトークン）を設定する
 
     Args:
         model: 使用するLLMモデル名
         llm_key: APIキーまたはトークン（オプション）
+        **options: モデル固有のオプション（LLMクラスのコンストラクタに渡される）
+    """
+    global _MODEL, _LLM_KEY, _OPTIONS
+    with _LOCK:
+        _MODEL = model
+        _LLM_KEY = llm_key
+        _OPTIONS = dict(options)
+
+
+@contextmanager
+def config_context(model: str, llm_key: Optional[str] = None, **options: Any) -> Iterator[None]:
+    """
+    with ブロック内（現在のスレッド・タスク）に限って設定を上書きする
+
+    グローバル設定は変更しないため、別スレッドや別タスクで異なるモデルを並行して使える。
+
+    Args:
+        model: 使用するLLMモデル名
+        llm_key: APIキーまたはトークン（オプション）
+        **options: モデル固有のオプション
     """
-    global _MODEL, _LLM_KEY
-    _MODEL = model
-    _LLM_KEY = llm_key
+    token = _CONTEXT_CONFIG.set((model, llm_key, dict(options)))
+    try:
+        yield
+    finally:
+        _CONTEXT_CONFIG.reset(token)
+
+
+def get_config() -> Tuple[str, Optional[str], Dict[str, Any]]:
+    """現在有効な設定（モデル名, LLMキー, オプション）を一貫したスナップショットとして返す"""
+    context = _CONTEXT_CONFIG.get()
+    if context is not None:
+        model, llm_key, options = context
+        return model, llm_key, dict(options)
+    with _LOCK:
+        return _MODEL, _LLM_KEY, dict(_OPTIONS)
 
 
 def get_model() -> str:
     """設定されたモデル名を返す"""
-    return _MODEL
+    return get_config()[0]
 
 
 def get_llm_key() -> Optional[str]:
     """設定されたLLMキーを返す"""
-    return _LLM_KEY
+    return get_config()[1]
+
+
+def get_options() -> Dict[str, Any]:
+    """設定されたモデル固有のオプションを返す"""
+    return get_config()[2]
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import time
+
+from .exceptions import DeadlineExceededError
+
+
+class Deadline:
+    """
+    ask / ask_batch 全体の締め切り。
+    同じ Deadline を後続のリクエストや再実行に渡すことで、残り時間が呼び出しごとに減っていく。
+    """
+
+    def __init__(self, seconds: float | None):
+        """
+        Args:
+            seconds: 締め切りまでの秒数。None の場合は締め切りなし
+        """
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def remaining(self) -> float | None:
+        """残り秒数を返す。締め切りがない場合は None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self) -> float | None:
+        """
+        次のLLM呼び出しに渡すタイムアウトを返す。
+        締め切りを過ぎている場合は DeadlineExceededError を投げる。
+        """
+        if self.expired:
+            raise DeadlineExceededError("締め切りを過ぎたためLLMの呼び出しを中止しました")
+        return self.remaining()
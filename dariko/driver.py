@@ -3,18 +3,31 @@ from __future__ import annotations
 
 import inspect
 import json
-from typing import Any, List, Type, Dict
+import threading
+from concurrent.futures import Executor, Future, wait
+from typing import Any, Callable, List, Optional, Type, Dict, TypeVar
 
+import requests
 from pydantic import BaseModel, TypeAdapter
 from pydantic import ValidationError as _PydanticValidationError
 
-from .config import get_llm_key, get_model
-from .exceptions import ValidationError
+from .budget import (
+    BUDGET_STATS,
+    BudgetStats,
+    estimate_output_tokens,
+    estimate_packed_output_tokens,
+    max_pack_size,
+)
+from .config import get_config
+from .deadline import Deadline
+from .exceptions import DeadlineExceededError, ValidationError
 from .model_utils import get_pydantic_model, infer_output_model
-from .models.llm import LLM
+from .packing import pack_prompts, packed_messages, packed_schema, unpack
+from .models.llm import LLM, Completion
 from .models.gpt import GPT
 from .models.gemma import Gemma
 from .models.claude import Claude
+from .models.openai_compatible import OpenAICompatible
 
 # モデル名とLLMクラスのマッピング
 MODEL_MAPPING: Dict[str, Type[LLM]] = {
@@ -23,6 +36,23 @@ MODEL_MAPPING: Dict[str, Type[LLM]] = {
     "claude": Claude,
 }
 
+# オプション名とLLMクラスのマッピング（モデル名より優先される）
+# 推論サーバー上のモデル名は任意のため、base_url の指定で OpenAI 互換 API に振り分ける
+OPTION_MAPPING: Dict[str, Type[LLM]] = {
+    "base_url": OpenAICompatible,
+}
+
+# パッキング時の1リクエストあたりのプロンプトトークン上限（デフォルト）
+DEFAULT_PACK_TOKEN_BUDGET = 2048
+
+# 設定ごとのLLMインスタンスのキャッシュ（ローカルモデルの再ロードを避ける）
+# 生成中のインスタンスも Future として登録し、同じ設定の呼び出しは完了を待つ
+_LLM_CACHE: Dict[tuple, Future] = {}
+_LLM_CACHE_LOCK = threading.Lock()
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
 # ─────────────────────────────────────────────────────────────
 # 内部ユーティリティ
 # ─────────────────────────────────────────────────────────────
@@ -43,27 +73,209 @@ def _resolve_model(output_model: Type[Any] | None) -> Type[BaseModel]:
     return get_pydantic_model(model)  # 型チェックも兼ねる
 
 
+def _resolve_llm_class(model_name: str, options: dict[str, Any]) -> Type[LLM]:
+    """
+    オプションとモデル名から対応するLLMクラスを返す
+    """
+    for option, llm_class in OPTION_MAPPING.items():
+        if option in options:
+            return llm_class
+    for prefix, llm_class in MODEL_MAPPING.items():
+        if prefix in model_name.lower():
+            return llm_class
+    raise ValueError(f"Unsupported model: {model_name}")
+
+
+def _create_llm(model_name: str, llm_key: str | None, options: dict[str, Any]) -> LLM:
+    """
+    モデル名・キー・オプションからLLMインスタンスを生成する
+    """
+    llm_class = _resolve_llm_class(model_name, options)
+    return llm_class.configure(model_name=model_name, llm_key=llm_key, **options)
+
+
 def _get_llm_instance() -> LLM:
     """
     設定に基づいて適切なLLMインスタンスを返す
     """
-    model_name = get_model()
-    llm_key = get_llm_key()
+    model_name, llm_key, options = get_config()
+    cache_key = (model_name, llm_key, repr(sorted(options.items())))
+    with _LLM_CACHE_LOCK:
+        future = _LLM_CACHE.get(cache_key)
+        creating = future is None
+        if creating:
+            future = _LLM_CACHE[cache_key] = Future()
+    if not creating:
+        return future.result()
 
-    # モデル名からLLMクラスを特定
-    for prefix, llm_class in MODEL_MAPPING.items():
-        if prefix in model_name.lower():
-            return llm_class.configure(model_name=model_name, llm_key=llm_key)
+    # モデルのロードはロックの外で行い、他の設定の呼び出しを待たせない
+    try:
+        llm = _create_llm(model_name, llm_key, options)
+    except BaseException as e:
+        # 失敗した設定はキャッシュせず、次の呼び出しで再試行する
+        with _LLM_CACHE_LOCK:
+            del _LLM_CACHE[cache_key]
+        future.set_exception(e)
+        raise
+    future.set_result(llm)
+    return llm
 
-    raise ValueError(f"Unsupported model: {model_name}")
 
+def _call_llm(
+    llm: LLM,
+    messages: list[dict[str, str]],
+    *,
+    schema: dict[str, Any],
+    max_tokens: int | None,
+    deadline: Deadline | None,
+) -> Completion:
+    """
+    締め切りまでの残り時間をタイムアウトとしてLLMを呼び出す。
+    """
+    timeout = deadline.timeout() if deadline is not None else None
+    try:
+        return llm.complete(messages, schema=schema, max_tokens=max_tokens, timeout=timeout)
+    except requests.exceptions.Timeout as e:
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceededError("締め切りまでにLLMの応答がありませんでした") from e
+        raise
 
-def _post_to_llm(messages: list[dict[str, str]]) -> str:
+
+def _ask_llm(
+    llm: LLM,
+    prompt: str,
+    pyd_model: Type[BaseModel],
+    *,
+    max_tokens: int | None = None,
+    stats: BudgetStats = BUDGET_STATS,
+    deadline: Deadline | None = None,
+) -> BaseModel:
     """
-    LLMを呼び出して content 文字列を返す。
+    指定したLLMインスタンスで単一プロンプトを実行し、検証済みオブジェクトを返す。
+    max_tokens を省略した場合は出力モデルのスキーマから出力トークン予算を見積もる。
+    見積もれない場合（長さ制約のない値を含む場合）はモデルごとの既定値を使い、予算の集計には含めない。
     """
-    llm = _get_llm_instance()
-    return llm.call(messages)
+    schema = pyd_model.model_json_schema()
+    budget = max_tokens or estimate_output_tokens(schema)
+    completion = _call_llm(
+        llm,
+        [
+            {"role": "system", "content": f"{schema}"},
+            {"role": "user", "content": prompt},
+        ],
+        schema=schema,
+        max_tokens=budget,
+        deadline=deadline,
+    )
+    if budget is not None:
+        stats.record(llm.model_name, budget, completion)
+    try:
+        return _parse_and_validate(completion.text, pyd_model, llm_key=llm.llm_key)
+    except ValidationError:
+        # ローカルモデルは締め切りで生成が打ち切られると不完全な JSON を返す
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceededError("締め切りを過ぎたためLLMの出力が途中で打ち切られました") from None
+        raise
+
+
+def _ask_llm_packed(
+    llm: LLM,
+    prompts: Dict[int, str],
+    pyd_model: Type[BaseModel],
+    *,
+    max_tokens: int | None = None,
+    stats: BudgetStats = BUDGET_STATS,
+    deadline: Deadline | None = None,
+) -> Dict[int, BaseModel]:
+    """
+    複数プロンプトを1リクエストにまとめて実行し、id ごとの検証済みオブジェクトを返す。
+    応答に含まれない・検証に失敗した要素は個別に再実行する。
+    max_tokens は1件あたりの出力トークン上限として扱い、id などの固定分を加えた件数分をリクエストの予算とする。
+    再実行の途中で締め切りを過ぎた場合は、それまでに得られた結果だけを返す。
+    """
+    if len(prompts) == 1:
+        i, prompt = next(iter(prompts.items()))
+        return {i: _ask_llm(llm, prompt, pyd_model, max_tokens=max_tokens, stats=stats, deadline=deadline)}
+
+    schema = pyd_model.model_json_schema()
+    schema_packed = packed_schema(schema, len(prompts))
+    budget = estimate_packed_output_tokens(max_tokens or estimate_output_tokens(schema), len(prompts))
+    completion = _call_llm(
+        llm, packed_messages(schema, prompts), schema=schema_packed, max_tokens=budget, deadline=deadline
+    )
+    stats.record(llm.model_name, budget, completion)
+    results = unpack(completion.text, pyd_model, list(prompts))
+    for i, prompt in prompts.items():
+        if i not in results:
+            try:
+                results[i] = _ask_llm(llm, prompt, pyd_model, max_tokens=max_tokens, stats=stats, deadline=deadline)
+            except DeadlineExceededError:
+                break
+    return results
+
+
+def _run_all(
+    fn: Callable[[_T], _R], items: List[_T], executor: Executor | None, deadline: Deadline | None
+) -> List[Optional[_R]]:
+    """
+    items の各要素に fn を適用した結果を入力順に返す。executor を指定した場合は並行に実行する。
+    締め切りを過ぎた場合は未着手の処理を取り消し、完了しなかった要素は None になる。
+    """
+    results: List[Optional[_R]] = [None] * len(items)
+    if executor is None:
+        for index, item in enumerate(items):
+            try:
+                results[index] = fn(item)
+            except DeadlineExceededError:
+                break
+        return results
+
+    futures = {executor.submit(fn, item): index for index, item in enumerate(items)}
+    done, not_done = wait(futures, timeout=deadline.remaining() if deadline is not None else None)
+    for future in not_done:
+        future.cancel()
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except DeadlineExceededError:
+            pass
+    return results
+
+
+def _ask_batch_llm(
+    llm: LLM,
+    prompts: List[str],
+    pyd_model: Type[BaseModel],
+    *,
+    pack_size: int | None = None,
+    pack_token_budget: int = DEFAULT_PACK_TOKEN_BUDGET,
+    max_tokens: int | None = None,
+    stats: BudgetStats = BUDGET_STATS,
+    deadline: Deadline | None = None,
+    executor: Executor | None = None,
+) -> List[Any]:
+    """
+    複数プロンプトを実行し、検証済みオブジェクトを入力順のリストで返す。
+    pack_size を指定した場合は複数プロンプトを1リクエストにまとめる。
+    まとめた応答が1リクエストあたりの出力トークン予算の上限を超える場合は、収まる件数まで pack_size を小さくする。
+    executor を指定した場合はリクエストを並行に実行する。
+    締め切りまでに完了しなかったプロンプトの結果は None になる。
+    """
+    options: Dict[str, Any] = {"max_tokens": max_tokens, "stats": stats, "deadline": deadline}
+    if pack_size is None:
+        return _run_all(lambda p: _ask_llm(llm, p, pyd_model, **options), prompts, executor, deadline)
+
+    capacity = max_pack_size(max_tokens or estimate_output_tokens(pyd_model.model_json_schema()))
+    if capacity is not None:
+        pack_size = min(pack_size, capacity)
+
+    def run(group: List[int]) -> Dict[int, BaseModel]:
+        return _ask_llm_packed(llm, {i: prompts[i] for i in group}, pyd_model, **options)
+
+    results: Dict[int, BaseModel] = {}
+    for packed in _run_all(run, pack_prompts(prompts, pack_size, pack_token_budget), executor, deadline):
+        results.update(packed or {})
+    return [results.get(i) for i in range(len(prompts))]
 
 
 def _parse_and_validate(raw_json: str, pyd_model: Type[BaseModel], *, llm_key: str) -> BaseModel:
@@ -88,36 +300,59 @@ def _parse_and_validate(raw_json: str, pyd_model: Type[BaseModel], *, llm_key: s
 # ─────────────────────────────────────────────────────────────
 # パブリック API
 # ─────────────────────────────────────────────────────────────
-def ask(prompt: str, *, output_model: Type[Any] | None = None) -> Any:
+def ask(
+    prompt: str,
+    *,
+    output_model: Type[Any] | None = None,
+    max_tokens: int | None = None,
+    deadline: float | None = None,
+) -> Any:
     """
     単一プロンプトを実行し、Pydantic 検証済みオブジェクトを返す。
+
+    Args:
+        prompt: プロンプト
+        output_model: 出力モデル（省略時は型アノテーションから推論）
+        max_tokens: 出力トークン数の上限（省略時は出力モデルのスキーマから見積もる）
+        deadline: 締め切りまでの秒数。過ぎた場合は DeadlineExceededError を投げる
+
+    Raises:
+        DeadlineExceededError: 締め切りまでに結果が得られなかった場合
     """
     pyd_model = _resolve_model(output_model)
-    llm_key = get_llm_key()
-
-    raw = _post_to_llm(
-        [
-            {"role": "system", "content": f"{pyd_model.model_json_schema()}"},
-            {"role": "user", "content": prompt},
-        ]
-    )
-    return _parse_and_validate(raw, pyd_model, llm_key=llm_key)
+    return _ask_llm(_get_llm_instance(), prompt, pyd_model, max_tokens=max_tokens, deadline=Deadline(deadline))
 
 
-def ask_batch(prompts: List[str], *, output_model: Type[Any] | None = None) -> List[Any]:
+def ask_batch(
+    prompts: List[str],
+    *,
+    output_model: Type[Any] | None = None,
+    pack_size: int | None = None,
+    pack_token_budget: int = DEFAULT_PACK_TOKEN_BUDGET,
+    max_tokens: int | None = None,
+    deadline: float | None = None,
+) -> List[Any]:
     """
     複数プロンプトをバッチ処理し、検証済みオブジェクトをリストで返す。
+
+    Args:
+        prompts: プロンプトのリスト
+        output_model: 出力モデル（省略時は型アノテーションから推論）
+        pack_size: 指定した場合、最大 pack_size 件のプロンプトを1リクエストにまとめる（パッキング）。
+            スキーマやリクエストのオーバーヘッドがプロンプトより大きい短い抽出タスク向け
+        pack_token_budget: パッキング時の1リクエストあたりのプロンプトトークン上限（概算）
+        max_tokens: 1件あたりの出力トークン数の上限（省略時は出力モデルのスキーマから見積もる）
+        deadline: バッチ全体の締め切りまでの秒数。過ぎた場合は残りの処理を中止し、
+            完了しなかったプロンプトの結果を None としたリストを返す
     """
     pyd_model = _resolve_model(output_model)
-    llm_key = get_llm_key()
-
-    results: list[Any] = []
-    for p in prompts:
-        raw = _post_to_llm(
-            [
-                {"role": "system", "content": f"{pyd_model.model_json_schema()}"},
-                {"role": "user", "content": p},
-            ]
-        )
-        results.append(_parse_and_validate(raw, pyd_model, llm_key=llm_key))
-    return results
+    llm = _get_llm_instance()
+    return _ask_batch_llm(
+        llm,
+        prompts,
+        pyd_model,
+        pack_size=pack_size,
+        pack_token_budget=pack_token_budget,
+        max_tokens=max_tokens,
+        deadline=Deadline(deadline),
+    )
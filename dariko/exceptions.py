@@ -7,3 +7,7 @@ class ValidationError(Exception):
     def __init__(self, original: _PydanticValidationError):
         super().__init__(str(original))
         self.original = original
+
+
+class DeadlineExceededError(TimeoutError):
+    """ask / ask_batch の締め切りを過ぎたことを表す例外"""
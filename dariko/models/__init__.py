@@ -1,9 +1,10 @@
-from .llm import LLM
+from .llm import LLM, Completion
 from .gpt import GPT
 from .gemma import Gemma
 from .claude import Claude
+from .openai_compatible import OpenAICompatible
 
-__all__ = ["LLM", "GPT", "Gemma", "Claude"]
+__all__ = ["LLM", "Completion", "GPT", "Gemma", "Claude", "OpenAICompatible"]
 
 # 型ヒント用のインポート
 from typing import Dict, List, Optional
@@ -1,12 +1,15 @@
 import requests
-from .llm import LLM
+from .llm import LLM, Completion
 
 class Claude(LLM):
     def __init__(self, model_name: str, llm_key: str):
         super().__init__(model_name, llm_key)
         self.api_url = "https://api.anthropic.com/v1/messages"
 
-    def call(self, messages):
+    def call(self, messages, *, schema=None, max_tokens=None, timeout=None):
+        return self.complete(messages, schema=schema, max_tokens=max_tokens, timeout=timeout).text
+
+    def complete(self, messages, *, schema=None, max_tokens=None, timeout=None):
         if not self.llm_key:
             raise ValueError("APIキーが必要です")
         headers = {
@@ -18,12 +21,19 @@ class Claude(LLM):
         prompt = self._format_messages(messages)
         payload = {
             "model": self.model_name,
-            "max_tokens": 1024,
+            "max_tokens": max_tokens or 1024,
             "messages": [{"role": "user", "content": prompt}]
         }
-        resp = requests.post(self.api_url, headers=headers, json=payload)
+        resp = requests.post(
+            self.api_url, headers=headers, json=payload, timeout=timeout if timeout is not None else 30
+        )
         resp.raise_for_status()
-        return resp.json()["content"][0]["text"]
+        data = resp.json()
+        return Completion(
+            text=data["content"][0]["text"],
+            truncated=data.get("stop_reason") == "max_tokens",
+            output_tokens=(data.get("usage") or {}).get("output_tokens"),
+        )
 
     def _format_messages(self, messages):
         return "\n".join([f"{m['role']}: {m['content']}" for m in messages]) 
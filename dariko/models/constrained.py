@@ -0,0 +1,515 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+# 連続して許可する空白文字の上限（空白だけを延々と生成するのを防ぐ）
+_MAX_WHITESPACE = 16
+
+_WHITESPACE = " \t\n\r"
+_DIGITS = "0123456789"
+_HEX_DIGITS = "0123456789abcdefABCDEF"
+
+# 任意の JSON 値を表すスキーマ
+_ANY: Dict[str, Any] = {}
+
+# トップレベルの値が閉じた後の状態（後続は空白のみ許可）
+_END = ("end",)
+
+# 空白を読み飛ばすフレーム（値の前後・区切り文字の前後）
+_WHITESPACE_FRAMES = frozenset({"end", "value", "array", "object"})
+
+# 数値の途中状態のうち、そこで値を終えてよいもの
+_NUMBER_COMPLETE = frozenset({"zero", "int", "frac", "expdigits"})
+
+# パーサーの状態: (フレームのスタック, 連続した空白の数)
+State = Tuple[Tuple[tuple, ...], int]
+
+
+class JSONSchemaMatcher:
+    """
+    文字列が JSON Schema に一致する JSON の「接頭辞」になっているかを判定する。
+
+    1文字ずつ状態を進めるプッシュダウン・オートマトンとして実装しており、
+    anyOf などで複数の解釈があり得る場合は状態の集合として保持する。
+    生成済みテキストの状態をキャッシュしておけば、新しいトークンの文字列だけを読めばよい。
+
+    対応するのは Pydantic の ``model_json_schema()`` が出力する範囲
+    （object / array / string / number / integer / boolean / null /
+    enum / const / anyOf / oneOf / allOf / $ref）。
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self._defs: Dict[str, Any] = {**schema.get("definitions", {}), **schema.get("$defs", {})}
+        # フレームに載せるためにスキーマを整数 ID で参照する（オブジェクトはリストで保持し続ける）
+        self._schemas: List[Any] = []
+        self._schema_ids: Dict[int, int] = {}
+        self._initial: FrozenSet[State] = frozenset({((_END, ("value", self._intern(schema))), 0)})
+
+    # ------------------------------------------------------------
+    # パブリック API
+    # ------------------------------------------------------------
+    def initial_states(self) -> FrozenSet[State]:
+        """何も読んでいない状態の集合を返す"""
+        return self._initial
+
+    def advance(self, states: FrozenSet[State], text: str) -> FrozenSet[State]:
+        """states から text を読み進めた状態の集合を返す。一致し得ない場合は空集合"""
+        for ch in text:
+            if not states:
+                break
+            states = frozenset(new for stack, ws in states for new in self._step(stack, ws, ch))
+        return states
+
+    @staticmethod
+    def classify(states: FrozenSet[State]) -> str:
+        """
+        状態の集合を "complete" / "partial" / "invalid" のいずれかに分類する。
+
+        - complete: スキーマに一致するトップレベルの値が閉じている（後続は空白のみ）
+        - partial : まだ続きを生成すればスキーマに一致し得る
+        - invalid : どのように続けても一致しない
+        """
+        if not states:
+            return "invalid"
+        if any(stack == (_END,) for stack, _ in states):
+            return "complete"
+        return "partial"
+
+    def state(self, text: str) -> str:
+        """text 全体を読んだ結果を classify と同じ値で返す"""
+        return self.classify(self.advance(self._initial, text))
+
+    def is_valid_prefix(self, text: str) -> bool:
+        return self.state(text) != "invalid"
+
+    def is_complete(self, text: str) -> bool:
+        return self.state(text) == "complete"
+
+    # ------------------------------------------------------------
+    # 内部ユーティリティ
+    # ------------------------------------------------------------
+    def _intern(self, schema: Any) -> int:
+        key = id(schema)
+        if key not in self._schema_ids:
+            self._schema_ids[key] = len(self._schemas)
+            self._schemas.append(schema)
+        return self._schema_ids[key]
+
+    def _resolve(self, schema: Any) -> Any:
+        if schema is True or not isinstance(schema, dict) or not schema:
+            return _ANY if schema is not False else False
+        while "$ref" in schema:
+            schema = self._defs[schema["$ref"].rsplit("/", 1)[-1]]
+        return schema
+
+    def _step(self, stack: Tuple[tuple, ...], ws: int, ch: str) -> Iterator[State]:
+        """スタック最上位のフレームに1文字を読ませ、遷移先の状態を列挙する"""
+        frame = stack[-1]
+        rest = stack[:-1]
+        kind = frame[0]
+
+        if ch in _WHITESPACE and kind in _WHITESPACE_FRAMES:
+            if ws < _MAX_WHITESPACE:
+                yield (stack, ws + 1)
+            return
+
+        if kind == "value":
+            for new in self._start(rest, frame[1], ch):
+                yield (new, 0)
+        elif kind == "literal":
+            _, text, pos = frame
+            if text[pos] == ch:
+                yield (rest if pos + 1 == len(text) else (*rest, ("literal", text, pos + 1)), 0)
+        elif kind == "string":
+            yield from self._step_string(rest, frame, ch)
+        elif kind == "number":
+            yield from self._step_number(rest, frame, ch)
+        elif kind == "array":
+            yield from self._step_array(rest, frame, ch)
+        elif kind == "object":
+            yield from self._step_object(rest, frame, ch)
+        elif kind == "key":
+            yield from self._step_key(rest, frame, ch)
+        # "end" は空白以外を受け付けない
+
+    def _start(self, rest: Tuple[tuple, ...], schema_id: int, ch: str) -> Iterator[Tuple[tuple, ...]]:
+        """ch を schema_id のスキーマに一致する値の先頭文字として読んだ後のスタックを列挙する"""
+        schema = self._resolve(self._schemas[schema_id])
+        if schema is False:
+            return
+        if schema is _ANY:
+            for t in ("object", "array", "string", "number", "boolean", "null"):
+                yield from self._start_type(rest, t, self._intern(_ANY), _ANY, ch)
+            return
+
+        if "const" in schema:
+            yield from _start_literal(rest, json.dumps(schema["const"], ensure_ascii=False), ch)
+            return
+        if "enum" in schema:
+            for value in schema["enum"]:
+                yield from _start_literal(rest, json.dumps(value, ensure_ascii=False), ch)
+            return
+        for key in ("anyOf", "oneOf", "allOf"):
+            if key in schema:
+                # allOf は Pydantic では単一要素のラッパーとしてのみ使われる
+                options = schema[key] if key != "allOf" else schema[key][:1]
+                for option in options:
+                    yield from self._start(rest, self._intern(option), ch)
+                return
+
+        types = schema.get("type")
+        if types is None:
+            yield from self._start(rest, self._intern(_ANY), ch)
+            return
+        if isinstance(types, str):
+            types = [types]
+        for t in types:
+            yield from self._start_type(rest, t, self._intern(schema), schema, ch)
+
+    def _start_type(
+        self, rest: Tuple[tuple, ...], t: str, schema_id: int, schema: Dict[str, Any], ch: str
+    ) -> Iterator[Tuple[tuple, ...]]:
+        if t == "object":
+            if ch == "{":
+                yield (*rest, ("object", schema_id, frozenset(), "start", None))
+        elif t == "array":
+            if ch == "[":
+                yield (*rest, ("array", schema_id, 0, "start"))
+        elif t == "string":
+            if ch == '"':
+                yield (*rest, ("string", schema.get("minLength", 0), schema.get("maxLength"), 0, 0))
+        elif t in ("integer", "number"):
+            phase = {"-": "sign", "0": "zero"}.get(ch, "int" if ch in _DIGITS else None)
+            if phase is not None:
+                yield (*rest, ("number", t == "integer", phase))
+        elif t == "boolean":
+            yield from _start_literal(rest, "true", ch)
+            yield from _start_literal(rest, "false", ch)
+        elif t == "null":
+            yield from _start_literal(rest, "null", ch)
+
+    def _step_string(self, rest: Tuple[tuple, ...], frame: tuple, ch: str) -> Iterator[State]:
+        # escape: 0 = 通常, 1 = バックスラッシュの直後, 2-5 = \u の後の16進数の桁
+        _, min_length, max_length, length, escape = frame
+        if escape == 1:
+            if ch == "u":
+                yield ((*rest, ("string", min_length, max_length, length, 2)), 0)
+            elif ch in '"\\/bfnrt':
+                yield ((*rest, ("string", min_length, max_length, length + 1, 0)), 0)
+            return
+        if escape >= 2:
+            if ch in _HEX_DIGITS:
+                if escape == 5:
+                    yield ((*rest, ("string", min_length, max_length, length + 1, 0)), 0)
+                else:
+                    yield ((*rest, ("string", min_length, max_length, length, escape + 1)), 0)
+            return
+        if ch == '"':
+            if length >= min_length:
+                yield (rest, 0)
+            return
+        if max_length is not None and length >= max_length:
+            return
+        if ch == "\\":
+            yield ((*rest, ("string", min_length, max_length, length, 1)), 0)
+        elif ord(ch) >= 0x20:
+            yield ((*rest, ("string", min_length, max_length, length + 1, 0)), 0)
+
+    def _step_number(self, rest: Tuple[tuple, ...], frame: tuple, ch: str) -> Iterator[State]:
+        _, integer, phase = frame
+        digit = ch in _DIGITS
+        fraction = not integer and ch == "." and phase in ("zero", "int")
+        exponent = not integer and ch in "eE" and phase in ("zero", "int", "frac")
+        if phase == "sign":
+            new = "zero" if ch == "0" else "int" if digit else None
+        elif phase == "zero":
+            new = "dot" if fraction else "exp" if exponent else None
+            if digit:
+                return  # 先頭の 0 の後に数字は続けられない
+        elif phase == "int":
+            new = "int" if digit else "dot" if fraction else "exp" if exponent else None
+        elif phase == "dot":
+            new = "frac" if digit else None
+        elif phase == "frac":
+            new = "frac" if digit else "exp" if exponent else None
+        elif phase == "exp":
+            new = "expsign" if ch in "+-" else "expdigits" if digit else None
+        else:  # expsign / expdigits
+            new = "expdigits" if digit else None
+
+        if new is not None:
+            yield ((*rest, ("number", integer, new)), 0)
+        elif phase in _NUMBER_COMPLETE:
+            # 数値はここで終わり、ch は親のフレームが読む
+            yield from self._step(rest, 0, ch)
+
+    def _step_array(self, rest: Tuple[tuple, ...], frame: tuple, ch: str) -> Iterator[State]:
+        _, schema_id, count, phase = frame
+        schema = self._schemas[schema_id]
+        items_id = self._intern(schema.get("items", _ANY))
+        min_items = schema.get("minItems", 0)
+        max_items = schema.get("maxItems")
+
+        if phase == "start":
+            if ch == "]":
+                if min_items == 0:
+                    yield (rest, 0)
+                return
+            if max_items == 0:
+                return
+            for new in self._start((*rest, ("array", schema_id, 1, "after_value")), items_id, ch):
+                yield (new, 0)
+        elif ch == "]":
+            if count >= min_items:
+                yield (rest, 0)
+        elif ch == ",":
+            if max_items is None or count < max_items:
+                yield ((*rest, ("array", schema_id, count + 1, "after_value"), ("value", items_id)), 0)
+
+    def _step_object(self, rest: Tuple[tuple, ...], frame: tuple, ch: str) -> Iterator[State]:
+        _, schema_id, seen, phase, key = frame
+        schema = self._schemas[schema_id]
+        required = schema.get("required", ())
+
+        if phase in ("start", "after_value") and ch == "}":
+            if all(name in seen for name in required) and len(seen) >= schema.get("minProperties", 0):
+                yield (rest, 0)
+        elif phase in ("start", "expect_key") and ch == '"':
+            if self._accepts_key(schema, seen):
+                yield ((*rest, frame, ("key", schema_id, seen, '"')), 0)
+        elif phase == "after_value" and ch == ",":
+            # 続けられるキーが残っていない場合はカンマを許可しない（閉じるしかなくなる）
+            if self._accepts_key(schema, seen):
+                yield ((*rest, ("object", schema_id, seen, "expect_key", None)), 0)
+        elif phase == "after_key" and ch == ":":
+            properties = schema.get("properties", {})
+            value_schema = properties[key] if key in properties else self._additional(schema)
+            parent = ("object", schema_id, seen | {key}, "after_value", None)
+            yield ((*rest, parent, ("value", self._intern(value_schema))), 0)
+
+    def _step_key(self, rest: Tuple[tuple, ...], frame: tuple, ch: str) -> Iterator[State]:
+        _, schema_id, seen, buffer = frame
+        schema = self._schemas[schema_id]
+        properties = schema.get("properties", {})
+        additional = self._additional(schema)
+        buffer += ch
+        status = _scan_string(buffer)
+        if status == "invalid":
+            return
+        if status == "partial":
+            if additional is not False or any(
+                json.dumps(name, ensure_ascii=False).startswith(buffer) for name in properties if name not in seen
+            ):
+                yield ((*rest, ("key", schema_id, seen, buffer)), 0)
+            return
+        name = json.loads(buffer)
+        if name in seen or (name not in properties and additional is False):
+            return
+        # 親のオブジェクトフレームをキーの直後の状態に置き換える
+        yield ((*rest[:-1], ("object", schema_id, seen, "after_key", name)), 0)
+
+    def _accepts_key(self, schema: Dict[str, Any], seen: FrozenSet[str]) -> bool:
+        """seen のキーを持つオブジェクトに、さらにキーを追加できるかを返す"""
+        max_properties = schema.get("maxProperties")
+        if max_properties is not None and len(seen) >= max_properties:
+            return False
+        if self._additional(schema) is not False:
+            return True
+        return any(name not in seen for name in schema.get("properties", {}))
+
+    @staticmethod
+    def _additional(schema: Dict[str, Any]) -> Any:
+        """未定義のキーに対する値のスキーマ（許可しない場合は False）"""
+        additional = schema.get("additionalProperties", not schema.get("properties"))
+        if additional is True:
+            return _ANY
+        return additional if additional else False
+
+
+def _start_literal(rest: Tuple[tuple, ...], literal: str, ch: str) -> Iterator[Tuple[tuple, ...]]:
+    if literal[0] == ch:
+        yield rest if len(literal) == 1 else (*rest, ("literal", literal, 1))
+
+
+def _scan_string(text: str) -> str:
+    """'"' で始まる text が JSON 文字列として閉じているか（"closed" / "partial" / "invalid"）を返す"""
+    pos = 1
+    while pos < len(text):
+        ch = text[pos]
+        if ch == '"':
+            return "closed" if pos == len(text) - 1 else "invalid"
+        if ch == "\\":
+            escape = text[pos + 1 : pos + 2]
+            if escape == "u":
+                hex_digits = text[pos + 2 : pos + 6]
+                if any(c not in _HEX_DIGITS for c in hex_digits):
+                    return "invalid"
+                pos += 6
+                continue
+            if escape and escape not in '"\\/bfnrt':
+                return "invalid"
+            pos += 2
+            continue
+        if ord(ch) < 0x20:
+            return "invalid"
+        pos += 1
+    return "partial"
+
+
+class TokenTexts:
+    """
+    トークン ID ごとの文字列を遅延して求め、キャッシュする。
+
+    SentencePiece 系のトークナイザは単独でデコードすると先頭の空白が落ちるため、
+    基準となるトークン列の後ろに付けてデコードした差分をトークンの文字列とする。
+    モデルのロード時に一度作り、呼び出しをまたいで再利用する。
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self._texts: Dict[int, str] = {}
+        self._anchor: Optional[List[int]] = None
+        self._anchor_text = ""
+        self._special_ids: Optional[set] = None
+        self._by_first_char: Optional[Dict[str, List[int]]] = None
+
+    def text(self, token_id: int) -> str:
+        """トークンの文字列を返す。特殊トークンは空文字列"""
+        if token_id not in self._texts:
+            if self._anchor is None:
+                self._anchor = self.tokenizer.encode("0", add_special_tokens=False)
+                self._anchor_text = self.tokenizer.decode(self._anchor, skip_special_tokens=True)
+                self._special_ids = set(self.tokenizer.all_special_ids)
+            if token_id in self._special_ids:
+                self._texts[token_id] = ""
+            else:
+                decoded = self.tokenizer.decode([*self._anchor, token_id], skip_special_tokens=True)
+                self._texts[token_id] = decoded[len(self._anchor_text) :]
+        return self._texts[token_id]
+
+    def by_first_char(self) -> Dict[str, List[int]]:
+        """先頭の文字ごとのトークン ID の一覧（初回のみ語彙全体をデコードする）"""
+        if self._by_first_char is None:
+            table: Dict[str, List[int]] = {}
+            for token_id in range(len(self.tokenizer)):
+                text = self.text(token_id)
+                if text:
+                    table.setdefault(text[0], []).append(token_id)
+            self._by_first_char = table
+        return self._by_first_char
+
+
+class _PrefixTracker:
+    """
+    行ごとに生成済みのトークン列とマッチャーの状態をキャッシュし、新しいトークンの分だけ状態を進める。
+    前回から1トークン伸びただけでない場合（ビームの入れ替えなど）は先頭から読み直す。
+    """
+
+    def __init__(self, matcher: JSONSchemaMatcher, token_texts: TokenTexts, prompt_length: int):
+        self.matcher = matcher
+        self.token_texts = token_texts
+        self.prompt_length = prompt_length
+        self._rows: Dict[int, Tuple[List[int], FrozenSet[State]]] = {}
+
+    def states(self, row: int, input_ids: torch.LongTensor) -> FrozenSet[State]:
+        generated: List[int] = input_ids[self.prompt_length :].tolist()
+        cached = self._rows.get(row)
+        if cached is not None and cached[0] == generated:
+            return cached[1]
+        if cached is not None and cached[0] == generated[:-1]:
+            states = self.matcher.advance(cached[1], self.token_texts.text(generated[-1]))
+        else:
+            states = self.matcher.initial_states()
+            for token_id in generated:
+                states = self.matcher.advance(states, self.token_texts.text(token_id))
+        self._rows[row] = (generated, states)
+        return states
+
+
+class JSONSchemaLogitsProcessor(LogitsProcessor):
+    """
+    生成中のテキストが JSON Schema の接頭辞であり続けるトークンだけを残す LogitsProcessor。
+
+    生成済みテキストに対するマッチャーの状態をキャッシュし、候補トークンの文字列だけを読み進めて判定する。
+    スコア上位 ``top_k`` 件を検査し、その中に候補がない場合は、先頭の文字を受理できるトークンだけを
+    スコア順に検査する。
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        schema: Dict[str, Any],
+        prompt_length: int,
+        top_k: int = 32,
+        token_texts: Optional[TokenTexts] = None,
+    ):
+        self.tokenizer = tokenizer
+        self.matcher = JSONSchemaMatcher(schema)
+        self.token_texts = token_texts or TokenTexts(tokenizer)
+        self.top_k = top_k
+        self._tracker = _PrefixTracker(self.matcher, self.token_texts, prompt_length)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        mask = torch.full_like(scores, float("-inf"))
+        for row in range(input_ids.shape[0]):
+            states = self._tracker.states(row, input_ids[row])
+            for token_id in self._allowed(states, scores[row]):
+                mask[row, token_id] = 0.0
+        return scores + mask
+
+    def _accepts(self, states: FrozenSet[State], token_id: int) -> bool:
+        # 特殊トークン（文字列が空）は許可しない。EOS 等で未完成の JSON のまま終わらせない
+        text = self.token_texts.text(token_id)
+        return bool(text) and bool(self.matcher.advance(states, text))
+
+    def _allowed(self, states: FrozenSet[State], scores: torch.FloatTensor) -> List[int]:
+        top = torch.topk(scores, k=min(self.top_k, scores.shape[-1]))
+        allowed = [
+            token_id
+            for score, token_id in zip(top.values.tolist(), top.indices.tolist())
+            if score != float("-inf") and self._accepts(states, token_id)
+        ]
+        if allowed:
+            return allowed
+
+        # 上位に候補がない場合は、先頭の文字を受理できるトークンに絞ってスコア順に検査する
+        candidates = [
+            token_id
+            for ch, token_ids in self.token_texts.by_first_char().items()
+            if self.matcher.advance(states, ch)
+            for token_id in token_ids
+        ]
+        if candidates:
+            candidate_scores = scores[torch.tensor(candidates, device=scores.device)]
+            for index in torch.argsort(candidate_scores, descending=True).tolist():
+                if candidate_scores[index] == float("-inf"):
+                    break
+                if self._accepts(states, candidates[index]):
+                    allowed.append(candidates[index])
+                    if len(allowed) >= self.top_k:
+                        break
+        if not allowed and self.tokenizer.eos_token_id is not None:
+            # どのトークンでも続けられない場合は生成を終わらせる
+            allowed.append(self.tokenizer.eos_token_id)
+        return allowed
+
+
+class JSONCompleteStoppingCriteria(StoppingCriteria):
+    """トップレベルの JSON 値が閉じた時点で生成を止める StoppingCriteria"""
+
+    def __init__(self, tokenizer, schema: Dict[str, Any], prompt_length: int, token_texts: Optional[TokenTexts] = None):
+        self.tokenizer = tokenizer
+        self.matcher = JSONSchemaMatcher(schema)
+        self._tracker = _PrefixTracker(self.matcher, token_texts or TokenTexts(tokenizer), prompt_length)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = [
+            self.matcher.classify(self._tracker.states(row, input_ids[row])) == "complete"
+            for row in range(input_ids.shape[0])
+        ]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
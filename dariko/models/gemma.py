@@ -1,40 +1,144 @@
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 import os
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, LogitsProcessorList, StoppingCriteriaList
 
-from .llm import LLM
+from .constrained import JSONCompleteStoppingCriteria, JSONSchemaLogitsProcessor, TokenTexts
+from .llm import LLM, Completion
+
+# 選択可能な推論プロファイル
+PROFILES = ("cpu",)
+
+
+def _cpu_supports_bf16() -> bool:
+    """CPU が bfloat16 をネイティブに演算できるか（AVX512-BF16 / AMX）を返す"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
 
 
 class Gemma(LLM):
     """Google Gemmaモデル用の実装"""
 
-    def __init__(self, model_name: str, llm_key: str = None):
+    def __init__(
+        self,
+        model_name: str,
+        llm_key: Optional[str] = None,
+        *,
+        constrained: bool = True,
+        profile: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        quantize: bool = False,
+        compile: bool = False,
+        dtype: Optional[torch.dtype] = None,
+    ):
+        """
+        Args:
+            model_name: Hugging Face のモデル名
+            llm_key: Hugging Face のアクセストークン（gated なモデルのみ必要。None の場合は環境の認証情報を使う）
+            constrained: True の場合、出力モデルのスキーマに一致する JSON だけを生成し、
+                トップレベルの値が閉じた時点で生成を止める
+            profile: 推論プロファイル。"cpu" の場合は CPU 向けの dtype（bf16 / fp32）で読み込み、
+                ロード時に一度ウォームアップする。None の場合は float16 + device_map="auto"
+            num_threads: intra-op スレッド数（プロセス全体の設定として torch に反映される）
+            quantize: Linear 層を動的 int8 量子化する（profile="cpu" のみ）
+            compile: forward を torch.compile でコンパイルする
+            dtype: 読み込む dtype。None の場合はプロファイルに応じて選ぶ（上記）
+        """
         super().__init__(model_name=model_name, llm_key=llm_key)
-        if not llm_key:
-            raise ValueError("Hugging Face token is required for Gemma models")
+        if profile is not None and profile not in PROFILES:
+            raise ValueError(f"Unsupported profile: {profile}")
+        if quantize and profile != "cpu":
+            raise ValueError("quantize is only supported with profile='cpu'")
+        if quantize and dtype not in (None, torch.float32):
+            raise ValueError("quantize requires dtype=torch.float32")
+        self.constrained = constrained
+        self.profile = profile
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
 
         self.tokenizer = AutoTokenizer.from_pretrained(model_name, token=llm_key)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name, device_map="auto", torch_dtype=torch.float16, token=llm_key
-        )
+        # 制約付き生成で使うトークンごとの文字列（呼び出しをまたいでキャッシュする）
+        self._token_texts = TokenTexts(self.tokenizer)
+        if profile == "cpu":
+            # 動的量子化は fp32 の Linear 層が前提
+            if dtype is None:
+                dtype = torch.bfloat16 if _cpu_supports_bf16() and not quantize else torch.float32
+            self.model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype, token=llm_key)
+        else:
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_name, device_map="auto", torch_dtype=dtype or torch.float16, token=llm_key
+            )
+        self.model.eval()
 
-    def call(self, messages: List[Dict[str, str]]) -> str:
+        if quantize:
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        if compile:
+            # プロンプト長ごとの再コンパイルを避けるため動的シェイプで
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
+        if profile == "cpu":
+            self._warmup()
+
+    def _warmup(self) -> None:
+        """短いプロンプトで一度生成し、初回呼び出し時のコンパイル・メモリ確保を済ませておく"""
+        inputs = self.tokenizer("warmup", return_tensors="pt").to(self.model.device)
+        with torch.inference_mode():
+            self.model.generate(**inputs, max_new_tokens=4, do_sample=False)
+
+    def call(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
         """Gemmaモデルを呼び出して応答を取得する"""
+        return self.complete(messages, schema=schema, max_tokens=max_tokens, timeout=timeout).text
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Completion:
+        """Gemmaモデルを呼び出し、応答と生成トークン数による打ち切りの有無を返す"""
         # メッセージをプロンプト形式に変換
         prompt = self._format_messages(messages)
 
         # トークン化
         inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        prompt_length = inputs["input_ids"].shape[-1]
 
         # 生成
-        outputs = self.model.generate(**inputs, max_new_tokens=512, temperature=0.7, do_sample=True)
+        generate_kwargs: Dict[str, Any] = {}
+        if timeout is not None:
+            # 生成にかける時間の上限（超えた時点で打ち切られる）
+            generate_kwargs["max_time"] = timeout
+        if self.constrained and schema is not None:
+            generate_kwargs["logits_processor"] = LogitsProcessorList(
+                [JSONSchemaLogitsProcessor(self.tokenizer, schema, prompt_length, token_texts=self._token_texts)]
+            )
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList(
+                [JSONCompleteStoppingCriteria(self.tokenizer, schema, prompt_length, token_texts=self._token_texts)]
+            )
+        max_new_tokens = max_tokens or 512
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs, max_new_tokens=max_new_tokens, temperature=0.7, do_sample=True, **generate_kwargs
+            )
 
-        # デコード
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-
-        # プロンプト部分を除去
-        return response[len(prompt) :]
+        # プロンプト部分（トークン単位）を除去してデコード
+        output_tokens = len(outputs[0]) - prompt_length
+        return Completion(
+            text=self.tokenizer.decode(outputs[0][prompt_length:], skip_special_tokens=True),
+            truncated=output_tokens >= max_new_tokens,
+            output_tokens=output_tokens,
+        )
 
     def _format_messages(self, messages: List[Dict[str, str]]) -> str:
         """メッセージリストをプロンプト形式に変換"""
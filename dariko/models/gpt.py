@@ -1,7 +1,11 @@
 import requests
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 
-from .llm import LLM
+from .llm import LLM, Completion
+
+# 推論モデルのモデル名の接頭辞。max_completion_tokens に推論トークンも含まれるため、
+# 出力のスキーマから見積もった予算では推論だけで上限に達し、応答が空になる
+REASONING_MODEL_PREFIXES = ("o1", "o3", "o4", "gpt-5")
 
 
 class GPT(LLM):
@@ -10,27 +14,57 @@ class GPT(LLM):
     def __init__(self, model_name: str, llm_key: str):
         super().__init__(model_name=model_name, llm_key=llm_key)
         self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.reasoning = model_name.lower().startswith(REASONING_MODEL_PREFIXES)
 
-    def call(self, messages: List[Dict[str, str]]) -> str:
+    def call(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
         """OpenAI APIを呼び出して応答を取得する"""
+        return self.complete(messages, schema=schema, max_tokens=max_tokens, timeout=timeout).text
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Completion:
+        """OpenAI APIを呼び出し、応答と finish_reason / usage による打ち切りの有無を返す"""
         if not self.llm_key:
             raise ValueError("API key is required for OpenAI models")
 
+        payload = {
+            "model": self.model_name,
+            "messages": messages,
+            "response_format": {"type": "json_object"},
+        }
+        if max_tokens is not None and not self.reasoning:
+            # max_tokens は o1 系などの推論モデルでは受け付けられない
+            payload["max_completion_tokens"] = max_tokens
+
         r = requests.post(
             self.api_url,
             headers={
                 "Authorization": f"Bearer {self.llm_key}",
                 "Content-Type": "application/json",
             },
-            json={
-                "model": self.model_name,
-                "messages": messages,
-                "response_format": {"type": "json_object"},
-            },
-            timeout=30,
+            json=payload,
+            timeout=timeout if timeout is not None else 30,
         )
 
         if r.status_code != 200:
             raise RuntimeError(f"OpenAI API call failed: {r.text}")
 
-        return r.json()["choices"][0]["message"]["content"]
+        data = r.json()
+        choice = data["choices"][0]
+        return Completion(
+            text=choice["message"]["content"],
+            truncated=choice.get("finish_reason") == "length",
+            output_tokens=(data.get("usage") or {}).get("completion_tokens"),
+        )
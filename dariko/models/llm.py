@@ -1,5 +1,20 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Type
+from typing import Any, Dict, List, NamedTuple, Optional, Type
+
+
+class Completion(NamedTuple):
+    """
+    LLMの応答と、出力トークン予算に対する結果
+
+    Attributes:
+        text: 応答テキスト
+        truncated: 出力トークン数の上限で打ち切られたか。モデルが報告しない場合は None
+        output_tokens: 出力トークン数。モデルが報告しない場合は None
+    """
+
+    text: str
+    truncated: Optional[bool] = None
+    output_tokens: Optional[int] = None
 
 
 class LLM(ABC):
@@ -10,11 +25,41 @@ class LLM(ABC):
         self.llm_key = llm_key
 
     @abstractmethod
-    def call(self, messages: List[Dict[str, str]]) -> str:
-        """LLMを呼び出して応答を取得する"""
+    def call(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        LLMを呼び出して応答を取得する
+
+        Args:
+            messages: チャット形式のメッセージリスト
+            schema: 出力モデルの JSON Schema。制約付き生成に対応するモデルのみが利用する
+            max_tokens: 出力トークン数の上限。None の場合はモデルごとの既定値
+            timeout: この呼び出しに使える秒数。None の場合はモデルごとの既定値
+        """
         pass
 
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Completion:
+        """
+        LLMを呼び出し、応答を打ち切りの有無・出力トークン数とともに返す。
+        引数は call と同じ。既定の実装は call の応答だけを返すため、
+        打ち切りを報告できるモデルはオーバーライドする。
+        """
+        return Completion(self.call(messages, schema=schema, max_tokens=max_tokens, timeout=timeout))
+
     @classmethod
-    def configure(cls, model_name: str, llm_key: Optional[str] = None) -> "LLM":
+    def configure(cls, model_name: str, llm_key: Optional[str] = None, **options: Any) -> "LLM":
         """LLMインスタンスを設定する"""
-        return cls(model_name=model_name, llm_key=llm_key)
+        return cls(model_name=model_name, llm_key=llm_key, **options)
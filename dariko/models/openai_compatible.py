@@ -0,0 +1,173 @@
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .llm import LLM, Completion
+
+# 構造化出力の指定方法（サーバーが対応しているものを選ぶ）
+#   json_schema: response_format={"type": "json_schema", ...}（vLLM, llama.cpp server, OpenAI 互換の標準）
+#   json_object: response_format={"type": "json_object"}（スキーマなしの JSON モード）
+#   guided_json: vLLM の拡張パラメータ guided_json
+STRUCTURED_OUTPUTS = ("json_schema", "json_object", "guided_json")
+
+
+class OpenAICompatible(LLM):
+    """OpenAI 互換 API を提供する推論サーバー（vLLM, llama.cpp server, TGI など）用の実装"""
+
+    def __init__(
+        self,
+        model_name: str,
+        llm_key: Optional[str] = None,
+        *,
+        base_url: str,
+        stream: bool = False,
+        structured_output: Optional[str] = "json_schema",
+        pool_maxsize: int = 10,
+        request_timeout: float = 60,
+    ):
+        """
+        Args:
+            model_name: サーバー上のモデル名
+            llm_key: API キー（サーバーが要求する場合のみ）
+            base_url: API のベース URL（例: "http://localhost:8000/v1"）
+            stream: True の場合、応答をストリーミングで受け取る。締め切りは受信中も確認される
+            structured_output: 構造化出力の指定方法（STRUCTURED_OUTPUTS のいずれか）。None の場合は指定しない
+            pool_maxsize: 再利用のために保持する接続数。同時接続数の上限ではなく、超えた分のリクエストも
+                待たずに新しい接続で送られ、終了後に閉じられる。同時実行数は呼び出し側（Client の max_workers）で制限する
+            request_timeout: 締め切りが指定されない場合のタイムアウト（秒）
+        """
+        super().__init__(model_name=model_name, llm_key=llm_key)
+        if structured_output is not None and structured_output not in STRUCTURED_OUTPUTS:
+            raise ValueError(f"Unsupported structured_output: {structured_output}")
+        self.api_url = base_url.rstrip("/") + "/chat/completions"
+        self.stream_enabled = stream
+        self.structured_output = structured_output
+        self.request_timeout = request_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/json"
+        if llm_key:
+            self.session.headers["Authorization"] = f"Bearer {llm_key}"
+
+    def call(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """推論サーバーを呼び出して応答を取得する"""
+        return self.complete(messages, schema=schema, max_tokens=max_tokens, timeout=timeout).text
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Completion:
+        """推論サーバーを呼び出し、応答と finish_reason / usage による打ち切りの有無を返す"""
+        if self.stream_enabled:
+            parts: List[str] = []
+            finish_reason = None
+            for content, reason in self._stream_chunks(messages, schema, max_tokens, timeout):
+                parts.append(content)
+                finish_reason = reason or finish_reason
+            return Completion(text="".join(parts), truncated=finish_reason == "length")
+
+        r = self.session.post(
+            self.api_url,
+            json=self._payload(messages, schema, max_tokens),
+            timeout=timeout if timeout is not None else self.request_timeout,
+        )
+        if r.status_code != 200:
+            raise RuntimeError(f"OpenAI-compatible API call failed: {r.text}")
+        data = r.json()
+        choice = data["choices"][0]
+        return Completion(
+            text=choice["message"]["content"],
+            truncated=choice.get("finish_reason") == "length",
+            output_tokens=(data.get("usage") or {}).get("completion_tokens"),
+        )
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        """
+        推論サーバーの応答をストリーミングで受け取り、テキストの差分を順に返す。
+        timeout は受信全体にかけられる秒数で、超えた場合は requests.exceptions.Timeout を投げる。
+        """
+        for content, _ in self._stream_chunks(messages, schema, max_tokens, timeout):
+            if content:
+                yield content
+
+    def _stream_chunks(
+        self,
+        messages: List[Dict[str, str]],
+        schema: Optional[Dict[str, Any]],
+        max_tokens: Optional[int],
+        timeout: Optional[float],
+    ) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        ストリーミング応答のチャンクごとに (テキストの差分, finish_reason) を返す。
+        各読み込みのタイムアウトを残り時間に合わせるため、途中でサーバーが止まっても timeout を超えて待たない。
+        """
+        timeout = timeout if timeout is not None else self.request_timeout
+        expires_at = time.monotonic() + timeout
+        payload = {**self._payload(messages, schema, max_tokens), "stream": True}
+        with self.session.post(self.api_url, json=payload, stream=True, timeout=timeout) as r:
+            if r.status_code != 200:
+                raise RuntimeError(f"OpenAI-compatible API call failed: {r.text}")
+            sock = getattr(getattr(r.raw, "connection", None), "sock", None)
+            # text/event-stream は UTF-8 と定められているため、charset の指定に依らずバイト列から復号する
+            # （decode_unicode=True では charset がない場合に ISO-8859-1 として扱われる）
+            lines = r.iter_lines()
+            while True:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    raise requests.exceptions.ReadTimeout("Streaming response exceeded the timeout")
+                if sock is not None:
+                    sock.settimeout(remaining)
+                try:
+                    raw_line = next(lines)
+                except StopIteration:
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    # iter_lines は読み込みのタイムアウトを ConnectionError として送出する
+                    raise requests.exceptions.ReadTimeout("Streaming response was interrupted") from e
+                line = raw_line.decode("utf-8")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                if choices:
+                    yield choices[0].get("delta", {}).get("content") or "", choices[0].get("finish_reason")
+
+    def _payload(
+        self, messages: List[Dict[str, str]], schema: Optional[Dict[str, Any]], max_tokens: Optional[int]
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": self.model_name, "messages": messages}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        if self.structured_output == "json_schema" and schema is not None:
+            payload["response_format"] = {"type": "json_schema", "json_schema": {"name": "output", "schema": schema}}
+        elif self.structured_output == "guided_json" and schema is not None:
+            payload["guided_json"] = schema
+        elif self.structured_output is not None:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
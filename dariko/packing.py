@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Type
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic import ValidationError as _PydanticValidationError
+
+# パック時の1件あたりの推定オーバーヘッド（id・区切り文字など）
+_ITEM_OVERHEAD_TOKENS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する（1トークン ≒ 4文字）。
+    正確なトークナイザに依存せず、パッキングや予算の見積もりに使う。
+    """
+    return len(text) // 4 + 1
+
+
+def pack_prompts(prompts: List[str], pack_size: int, token_budget: int) -> List[List[int]]:
+    """
+    プロンプトのインデックスを、1リクエストあたり pack_size 件・token_budget トークン以内のグループに分ける。
+    単独で予算を超えるプロンプトは1件だけのグループになる。
+    """
+    if pack_size < 1:
+        raise ValueError("pack_size must be at least 1")
+    groups: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, prompt in enumerate(prompts):
+        tokens = estimate_tokens(prompt) + _ITEM_OVERHEAD_TOKENS
+        if current and (len(current) >= pack_size or current_tokens + tokens > token_budget):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def packed_schema(schema: Dict[str, Any], count: int) -> Dict[str, Any]:
+    """
+    出力モデルのスキーマから、count 件の id 付きの出力を配列で返すためのスキーマを組み立てる。
+    {"results": [{"id": 0, "output": {...}}, ...]}
+    """
+    item_schema = {k: v for k, v in schema.items() if k != "$defs"}
+    packed: Dict[str, Any] = {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "minItems": count,
+                "maxItems": count,
+                "items": {
+                    "type": "object",
+                    "properties": {"id": {"type": "integer"}, "output": item_schema},
+                    "required": ["id", "output"],
+                },
+            }
+        },
+        "required": ["results"],
+    }
+    if "$defs" in schema:
+        packed["$defs"] = schema["$defs"]
+    return packed
+
+
+def packed_messages(schema: Dict[str, Any], prompts: Dict[int, str]) -> List[Dict[str, str]]:
+    """
+    複数のプロンプトを1リクエストにまとめたメッセージを組み立てる。
+    """
+    items = [{"id": i, "input": p} for i, p in prompts.items()]
+    instruction = (
+        "以下の各入力について個別に出力を作成し、"
+        '{"results": [{"id": <入力の id>, "output": <出力>}, ...]} の形式の JSON で、'
+        "すべての id について返してください。"
+    )
+    return [
+        {"role": "system", "content": f"{packed_schema(schema, len(prompts))}"},
+        {"role": "user", "content": f"{instruction}\n\n{json.dumps(items, ensure_ascii=False)}"},
+    ]
+
+
+def unpack(raw_json: str, pyd_model: Type[BaseModel], ids: List[int]) -> Dict[int, BaseModel]:
+    """
+    パックされた応答を id ごとに検証する。
+    欠けている・重複している・検証に失敗した要素は結果に含めない（呼び出し側で個別に再実行する）。
+    """
+    try:
+        data = json.loads(raw_json)
+    except json.JSONDecodeError:
+        return {}
+    results = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        return {}
+
+    adapter = TypeAdapter(pyd_model)
+    expected = set(ids)
+    validated: Dict[int, BaseModel] = {}
+    duplicated = set()
+    for element in results:
+        if not isinstance(element, dict):
+            continue
+        i = element.get("id")
+        if not isinstance(i, int) or i not in expected:
+            continue
+        if i in validated:
+            duplicated.add(i)
+            continue
+        try:
+            validated[i] = adapter.validate_python(element.get("output"))
+        except _PydanticValidationError:
+            continue
+    for i in duplicated:
+        del validated[i]
+    return validated
@@ -0,0 +1,80 @@
+"""
+ローカルモデルの CPU 推論プロファイルごとの tokens/sec を計測するベンチマーク。
+
+使い方:
+    python scripts/benchmark_cpu.py
+    DARIKO_API_KEY=<Hugging Face トークン> python scripts/benchmark_cpu.py --model google/gemma-2b --runs 5 --num-threads 8
+
+既定のチェックポイントは公開されているため、トークンなしで実行できる。
+gated なモデル（google/gemma-2b など）を計測する場合のみトークンを指定する。
+"""
+
+import argparse
+import os
+import time
+from typing import Optional
+
+import torch
+
+from dariko.models.gemma import Gemma
+
+# 比較するプロファイル（名前, Gemma に渡すオプション）
+# baseline はプロファイルなしで fp32 のまま読み込んだ場合（CPU プロファイルの効果を比べる基準）
+PROFILES = [
+    ("baseline (fp32)", {"dtype": torch.float32}),
+    ("cpu", {"profile": "cpu"}),
+    ("cpu+int8", {"profile": "cpu", "quantize": True}),
+    ("cpu+compile", {"profile": "cpu", "compile": True}),
+    ("cpu+int8+compile", {"profile": "cpu", "quantize": True, "compile": True}),
+]
+
+MESSAGES = [
+    {"role": "system", "content": "Return a JSON object describing a person."},
+    {"role": "user", "content": "山田太郎, 25歳"},
+]
+
+
+def benchmark(model_name: str, llm_key: Optional[str], options: dict, runs: int, max_tokens: int) -> tuple:
+    """
+    ロード時間（秒）と tokens/sec を返す。
+    tokens/sec は生成したトークン数（プロンプトを除く）を生成時間で割った値で、
+    初回呼び出しのコンパイル・メモリ確保の影響を除くため、計測前に一度生成しておく。
+    """
+    start = time.perf_counter()
+    llm = Gemma(model_name, llm_key, constrained=False, **options)
+    load_seconds = time.perf_counter() - start
+    llm.complete(MESSAGES, max_tokens=max_tokens)
+
+    tokens = 0
+    elapsed = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        completion = llm.complete(MESSAGES, max_tokens=max_tokens)
+        elapsed += time.perf_counter() - start
+        tokens += completion.output_tokens
+    return load_seconds, tokens / elapsed if elapsed else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="hf-internal-testing/tiny-random-GemmaForCausalLM")
+    parser.add_argument("--llm-key", default=os.environ.get("DARIKO_API_KEY") or os.environ.get("HF_TOKEN"))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--max-tokens", type=int, default=128, help="1回の生成で生成するトークン数の上限（全プロファイル共通）"
+    )
+    parser.add_argument("--num-threads", type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"model: {args.model}")
+    print(f"max tokens: {args.max_tokens}")
+    print(f"{'profile':<20}{'load [s]':>10}{'tokens/sec':>14}")
+    for name, options in PROFILES:
+        load_seconds, tps = benchmark(
+            args.model, args.llm_key, {**options, "num_threads": args.num_threads}, args.runs, args.max_tokens
+        )
+        print(f"{name:<20}{load_seconds:>10.2f}{tps:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,9 @@ from unittest.mock import patch
 import pytest
 from pydantic import BaseModel
 
+import dariko.driver
 from dariko import set_config
+from dariko.models.llm import Completion
 
 
 class Person(BaseModel):
@@ -20,6 +22,14 @@ def set_api_key():
     set_config(model="gpt-4o-mini", llm_key="test_key")
 
 
+@pytest.fixture(autouse=True)
+def clear_llm_cache():
+    """テスト間でLLMインスタンスのキャッシュを共有しない"""
+    dariko.driver._LLM_CACHE.clear()
+    yield
+    dariko.driver._LLM_CACHE.clear()
+
+
 def mock_gpt_response(*args, **kwargs):
     """GPTモデルのモックレスポンス"""
     class MockResponse:
@@ -49,6 +59,11 @@ def mock_gemma_response(*args, **kwargs):
     return '{"name": "test", "age": 20, "dummy": true}'
 
 
+def mock_gemma_completion(*args, **kwargs):
+    """Gemmaモデルのモックレスポンス（Gemma.complete 用）"""
+    return Completion(mock_gemma_response(), truncated=False, output_tokens=16)
+
+
 def mock_claude_response(*args, **kwargs):
     """Claudeモデルのモックレスポンス"""
     class MockResponse:
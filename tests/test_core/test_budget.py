@@ -0,0 +1,176 @@
+import json
+import math
+from typing import Dict, List
+from unittest.mock import patch
+
+from pydantic import BaseModel, Field
+
+from dariko import ask, ask_batch, budget_report, set_config
+from dariko.budget import (
+    _MAX_BUDGET,
+    BUDGET_STATS,
+    BudgetStats,
+    estimate_output_tokens,
+    estimate_packed_output_tokens,
+    max_pack_size,
+)
+from dariko.models.llm import Completion
+from tests.conftest import Person, mock_gpt_response
+
+
+class Tag(BaseModel):
+    label: str = Field(max_length=10)
+
+
+class Article(BaseModel):
+    title: str = Field(max_length=100)
+    tags: List[Tag] = Field(max_length=3)
+
+
+class LongArticle(Article):
+    title: str = Field(max_length=1000)
+
+
+class BoundedPerson(BaseModel):
+    name: str = Field(max_length=20)
+    age: int
+    dummy: bool
+
+
+class Profile(BaseModel):
+    name: str = Field(max_length=100)
+    company: str = Field(max_length=100)
+    title: str = Field(max_length=100)
+    city: str = Field(max_length=100)
+    summary: str = Field(max_length=100)
+
+
+PROFILE = {"name": "a", "company": "b", "title": "c", "city": "d", "summary": "e"}
+
+
+def test_estimate_output_tokens():
+    """スキーマの制約に応じた出力トークン予算の見積もりテスト"""
+    tag = estimate_output_tokens(Tag.model_json_schema())
+    article = estimate_output_tokens(Article.model_json_schema())
+    assert 0 < tag < article
+    # 長さ制約が大きいほど予算も大きい
+    assert estimate_output_tokens(LongArticle.model_json_schema()) > article
+    # 安全係数
+    assert estimate_output_tokens(Article.model_json_schema(), margin=1.0) < article
+
+
+def test_estimate_output_tokens_unbounded():
+    """長さ制約のない文字列・配列・任意のキーを含む場合は見積もらないこと"""
+
+    class Tags(BaseModel):
+        tags: List[Tag]
+
+    class Scores(BaseModel):
+        scores: Dict[str, int]
+
+    assert estimate_output_tokens(Person.model_json_schema()) is None
+    assert estimate_output_tokens(Tags.model_json_schema()) is None
+    assert estimate_output_tokens(Scores.model_json_schema()) is None
+
+
+def test_budget_stats():
+    """予算到達率の集計テスト"""
+    stats = BudgetStats()
+    stats.record("gpt-4o-mini", 10, Completion("x" * 8, truncated=False, output_tokens=4))
+    stats.record("gpt-4o-mini", 10, Completion("x" * 40, truncated=True, output_tokens=10))
+    report = stats.report()["gpt-4o-mini"]
+    assert report["calls"] == 2
+    assert report["hits"] == 1
+    assert report["hit_rate"] == 0.5
+    assert report["mean_used"] == 7
+    assert report["utilization"] == 0.7
+
+
+def test_budget_stats_prefers_reported_truncation():
+    """打ち切りはモデルの報告で判定し、報告がない場合のみ概算を使うこと"""
+    stats = BudgetStats()
+    # 概算では予算に達していても、打ち切られていなければ到達としない
+    stats.record("model", 10, Completion("x" * 80, truncated=False))
+    # 概算では予算未満でも、打ち切りが報告されれば到達とする
+    stats.record("model", 10, Completion("x", truncated=True))
+    # 報告がない場合は概算
+    stats.record("model", 10, Completion("x" * 80))
+    assert stats.report()["model"]["hits"] == 2
+
+
+def mock_truncating_gpt_response(url, **kwargs):
+    """max_completion_tokens が小さい場合は打ち切られた応答を返すGPTのモック"""
+    response = mock_gpt_response()
+    limit = kwargs["json"].get("max_completion_tokens")
+    truncated = limit is not None and limit < 16
+    response._json["choices"][0]["finish_reason"] = "length" if truncated else "stop"
+    response._json["usage"] = {"completion_tokens": 16 if limit is None else min(limit, 16)}
+    return response
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_truncating_gpt_response)
+def test_ask_passes_budget(mock_post):
+    """スキーマから見積もった予算と、呼び出しごとの上書きが渡されること"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    BUDGET_STATS.reset()
+    ask("test", output_model=BoundedPerson)
+    payload = mock_post.call_args.kwargs["json"]
+    assert payload["max_completion_tokens"] == estimate_output_tokens(BoundedPerson.model_json_schema())
+    assert "max_tokens" not in payload
+
+    ask("test", output_model=BoundedPerson, max_tokens=5)
+    assert mock_post.call_args.kwargs["json"]["max_completion_tokens"] == 5
+
+    report = budget_report()["gpt-4o-mini"]
+    assert report["calls"] == 2
+    assert report["hits"] == 1
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_truncating_gpt_response)
+def test_unbounded_schema_uses_provider_default(mock_post):
+    """予算を見積もれない出力モデルでは上限を送らず、集計にも含めないこと"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    BUDGET_STATS.reset()
+    ask("test", output_model=Person)
+    assert "max_completion_tokens" not in mock_post.call_args.kwargs["json"]
+    assert budget_report() == {}
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_truncating_gpt_response)
+def test_reasoning_model_skips_budget(mock_post):
+    """推論モデルには出力トークンの上限を送らないこと"""
+    set_config(model="gpt-5-mini", llm_key="test_key")
+    ask("test", output_model=BoundedPerson)
+    assert "max_completion_tokens" not in mock_post.call_args.kwargs["json"]
+
+
+def mock_packed_profile_response(url, **kwargs):
+    """パックされたリクエストのすべての id に Profile を返すGPTのモック"""
+    messages = kwargs["json"]["messages"]
+    items = json.loads(messages[1]["content"].split("\n\n", 1)[1])
+    response = mock_gpt_response()
+    results = [{"id": item["id"], "output": PROFILE} for item in items]
+    response._json["choices"][0]["message"]["content"] = json.dumps({"results": results})
+    return response
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_packed_profile_response)
+def test_packed_budget_fits_cap(mock_post):
+    """まとめた応答の予算が上限に収まるようにパックが小さくなること（見積もり・上書きのどちらでも）"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    prompts = [f"test{i}" for i in range(10)]
+    item = estimate_output_tokens(Profile.model_json_schema())
+    for max_tokens, item_tokens in ((None, item), (1000, 1000)):
+        mock_post.reset_mock()
+        results = ask_batch(prompts, output_model=Profile, pack_size=10, max_tokens=max_tokens)
+        assert all(isinstance(r, Profile) for r in results)
+
+        capacity = max_pack_size(item_tokens)
+        assert 1 < capacity < 10
+        # 打ち切られずにすべての要素が返るため、個別の再実行は発生しない
+        assert mock_post.call_count == math.ceil(10 / capacity)
+        for call in mock_post.call_args_list:
+            count = len(json.loads(call.kwargs["json"]["messages"][1]["content"].split("\n\n", 1)[1]))
+            budget = call.kwargs["json"]["max_completion_tokens"]
+            assert budget == estimate_packed_output_tokens(item_tokens, count)
+            assert budget <= _MAX_BUDGET
@@ -0,0 +1,125 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from dariko import Client, ask, config_context, set_config
+from dariko.config import get_model
+from tests.conftest import Person, mock_claude_response, mock_gemma_completion, mock_gpt_response
+
+
+def mock_any_response(url, *args, **kwargs):
+    """URLに応じてGPT/Claudeのモックレスポンスを返す（requests.post は両モデルで共通のため）"""
+    if "anthropic" in url:
+        return mock_claude_response()
+    return mock_gpt_response()
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_gpt_response)
+def test_client_ask(mock_post):
+    """Clientのaskのテスト"""
+    client = Client("gpt-4o-mini", llm_key="client_key")
+    result: Person = client.ask("test", output_model=Person)
+    assert result.dummy is True
+    assert mock_post.call_args.kwargs["headers"]["Authorization"] == "Bearer client_key"
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_gpt_response)
+def test_client_ask_batch_concurrent(mock_post):
+    """max_workers を指定したバッチ処理のテスト"""
+    with Client("gpt-4o-mini", llm_key="client_key", max_workers=4) as client:
+        results = client.ask_batch([f"test{i}" for i in range(8)], output_model=Person)
+    assert len(results) == 8
+    assert all(isinstance(r, Person) for r in results)
+    assert mock_post.call_count == 8
+
+
+@patch("requests.post", side_effect=mock_any_response)
+def test_clients_do_not_share_config(mock_post):
+    """複数のClientが互いの設定やグローバル設定に影響しないこと"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    Client("claude-3-opus-20240229", llm_key="anthropic_key").ask("test", output_model=Person)
+    Client("gpt-4o-mini", llm_key="openai_key").ask("test", output_model=Person)
+    urls = sorted(call.args[0] for call in mock_post.call_args_list)
+    assert urls == ["https://api.anthropic.com/v1/messages", "https://api.openai.com/v1/chat/completions"]
+    assert get_model() == "gpt-4o-mini"
+
+
+@patch("requests.post", side_effect=mock_any_response)
+def test_config_context_is_thread_local(mock_post):
+    """config_context による上書きが他のスレッドに漏れないこと"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    entered = threading.Event()
+    release = threading.Event()
+    seen = {}
+
+    def worker():
+        with config_context("claude-3-opus-20240229", llm_key="anthropic_key"):
+            entered.set()
+            release.wait(timeout=5)
+            seen["worker"] = get_model()
+            ask("test", output_model=Person)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait(timeout=5)
+    seen["main"] = get_model()
+    ask("test", output_model=Person)
+    release.set()
+    thread.join()
+
+    assert seen == {"worker": "claude-3-opus-20240229", "main": "gpt-4o-mini"}
+    urls = sorted(call.args[0] for call in mock_post.call_args_list)
+    assert urls == ["https://api.anthropic.com/v1/messages", "https://api.openai.com/v1/chat/completions"]
+
+
+@patch("dariko.models.gemma.Gemma.complete", side_effect=mock_gemma_completion)
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+@patch("dariko.models.gpt.requests.post", side_effect=mock_gpt_response)
+def test_slow_model_load_does_not_block_other_models(mock_post, mock_model, mock_tokenizer, mock_call):
+    """ローカルモデルのロード中も、他の設定の ask がロードを待たずに実行できること"""
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load(*args, **kwargs):
+        loading.set()
+        release.wait(timeout=5)
+        return mock_model.return_value
+
+    mock_model.side_effect = slow_load
+    results = []
+
+    def worker():
+        with config_context("google/gemma-2b", llm_key="test_hf_token"):
+            results.append(ask("test", output_model=Person))
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    assert loading.wait(timeout=5)
+
+    # Gemma のロードが終わる前に GPT の呼び出しが完了する
+    gpt_done = threading.Event()
+    gpt = threading.Thread(target=lambda: ask("test", output_model=Person) and gpt_done.set())
+    gpt.start()
+    assert gpt_done.wait(timeout=2)
+
+    release.set()
+    gpt.join(timeout=5)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(results) == 2
+    # 同じ設定の呼び出しはロードの完了を待ち、モデルは一度だけロードされる
+    assert mock_model.call_count == 1
+
+
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained", side_effect=OSError("download failed"))
+def test_failed_model_load_is_not_cached(mock_model, mock_tokenizer):
+    """ロードに失敗した設定はキャッシュされず、次の呼び出しで再試行されること"""
+    set_config(model="google/gemma-2b", llm_key="test_hf_token")
+    for _ in range(2):
+        with pytest.raises(OSError, match="download failed"):
+            ask("test", output_model=Person)
+    assert mock_model.call_count == 2
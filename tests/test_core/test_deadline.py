@@ -0,0 +1,71 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from dariko import Client, DeadlineExceededError, ask, ask_batch, set_config
+from tests.conftest import Person, mock_gpt_response
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_gpt_response)
+def test_timeout_passed_to_provider(mock_post):
+    """締め切りまでの残り時間がタイムアウトとして渡されること"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    ask("test", output_model=Person, deadline=5.0)
+    assert 0 < mock_post.call_args.kwargs["timeout"] <= 5.0
+
+    ask("test", output_model=Person)
+    assert mock_post.call_args.kwargs["timeout"] == 30
+
+
+def test_ask_deadline_exceeded():
+    """締め切りまでに応答がない場合のテスト"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+
+    def slow_response(*args, timeout, **kwargs):
+        time.sleep(timeout)
+        raise requests.exceptions.ReadTimeout()
+
+    with patch("dariko.models.gpt.requests.post", side_effect=slow_response):
+        with pytest.raises(DeadlineExceededError):
+            ask("test", output_model=Person, deadline=0.05)
+
+
+def test_ask_batch_returns_completed_results():
+    """締め切りを過ぎた時点で残りのプロンプトを実行せず、完了した結果を返すこと"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+
+    def slow_response(*args, **kwargs):
+        time.sleep(0.05)
+        return mock_gpt_response()
+
+    with patch("dariko.models.gpt.requests.post", side_effect=slow_response) as mock_post:
+        results = ask_batch([f"test{i}" for i in range(10)], output_model=Person, deadline=0.12)
+    assert isinstance(results[0], Person)
+    assert results[-1] is None
+    assert len(results) == 10
+    assert mock_post.call_count < 10
+
+
+def test_client_ask_batch_cancels_outstanding_work():
+    """スレッドプール上の処理が締め切りで打ち切られること"""
+    release = threading.Event()
+
+    def response(url, **kwargs):
+        if kwargs["json"]["messages"][1]["content"] == "slow":
+            release.wait(timeout=5)
+        return mock_gpt_response()
+
+    with patch("dariko.models.gpt.requests.post", side_effect=response):
+        with Client("gpt-4o-mini", llm_key="test_key", max_workers=2) as client:
+            start = time.monotonic()
+            results = client.ask_batch(["fast", "slow", "slow", "fast"], output_model=Person, deadline=0.2)
+            elapsed = time.monotonic() - start
+            release.set()
+
+    assert elapsed < 1.0
+    assert isinstance(results[0], Person)
+    assert results[1] is None
+    assert results[2] is None
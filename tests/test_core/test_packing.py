@@ -0,0 +1,61 @@
+import json
+from unittest.mock import patch
+
+from dariko import ask_batch, set_config
+from dariko.packing import pack_prompts, unpack
+from tests.conftest import Person, mock_gpt_response
+
+PERSON = {"name": "test", "age": 20, "dummy": True}
+
+
+def mock_packed_gpt_response(url, **kwargs):
+    """パックされたリクエストには id 付きの配列を返す（id 1 は欠落、id 2 は不正）"""
+    messages = kwargs["json"]["messages"]
+    if "results" not in messages[0]["content"]:
+        return mock_gpt_response()
+    items = json.loads(messages[1]["content"].split("\n\n", 1)[1])
+    results = []
+    for item in items:
+        if item["id"] == 1:
+            continue
+        output = {"name": "test"} if item["id"] == 2 else PERSON
+        results.append({"id": item["id"], "output": output})
+    response = mock_gpt_response()
+    response._json["choices"][0]["message"]["content"] = json.dumps({"results": results})
+    return response
+
+
+def test_pack_prompts():
+    """件数とトークン予算によるグループ分けのテスト"""
+    assert pack_prompts(["a"] * 5, pack_size=2, token_budget=1000) == [[0, 1], [2, 3], [4]]
+    # 2件目で予算を超える
+    assert pack_prompts(["a" * 40, "b" * 40, "c"], pack_size=10, token_budget=30) == [[0], [1, 2]]
+
+
+def test_unpack():
+    """欠落・重複・不正な要素を除外するテスト"""
+    raw = json.dumps(
+        {
+            "results": [
+                {"id": 0, "output": PERSON},
+                {"id": 1, "output": PERSON},
+                {"id": 1, "output": PERSON},
+                {"id": 2, "output": {"name": "test"}},
+                {"id": 9, "output": PERSON},
+            ]
+        }
+    )
+    assert list(unpack(raw, Person, [0, 1, 2, 3])) == [0]
+    assert unpack("not json", Person, [0]) == {}
+
+
+@patch("dariko.models.gpt.requests.post", side_effect=mock_packed_gpt_response)
+def test_ask_batch_packed(mock_post):
+    """パッキング時のリクエスト数と、欠落・不正な要素の個別再実行のテスト"""
+    set_config(model="gpt-4o-mini", llm_key="test_key")
+    prompts = [f"test{i}" for i in range(8)]
+    results = ask_batch(prompts, output_model=Person, pack_size=4)
+    assert len(results) == 8
+    assert all(isinstance(r, Person) for r in results)
+    # パック 2 件 + 1 件目のパックの id 1, 2 の個別再実行
+    assert mock_post.call_count == 4
@@ -1,6 +1,7 @@
 from unittest.mock import patch
 
 from dariko import ask, set_config
+from dariko.models.claude import Claude
 from tests.conftest import Person, mock_claude_response
 
 
@@ -10,4 +11,29 @@ def test_configure_claude(mock_post):
     # AnthropicのAPIキーを設定
     set_config(model="claude-3-opus-20240229", llm_key="test_anthropic_key")
     result: Person = ask("test", output_model=Person)
-    assert result.dummy is True 
+    assert result.dummy is True
+
+
+@patch("dariko.models.claude.requests.post")
+def test_truncation_reported(mock_post):
+    """stop_reason と usage から打ち切りと出力トークン数が返されること"""
+    response = mock_claude_response()
+    response._json["stop_reason"] = "max_tokens"
+    response._json["usage"] = {"output_tokens": 8}
+    mock_post.return_value = response
+
+    llm = Claude("claude-3-opus-20240229", "test_key")
+    completion = llm.complete([{"role": "user", "content": "test"}], max_tokens=8)
+    assert completion.truncated is True
+    assert completion.output_tokens == 8
+
+
+@patch("dariko.models.claude.requests.post", side_effect=mock_claude_response)
+def test_timeout(mock_post):
+    """締め切りがない場合も有限のタイムアウトが設定されること"""
+    set_config(model="claude-3-opus-20240229", llm_key="test_anthropic_key")
+    ask("test", output_model=Person)
+    assert mock_post.call_args.kwargs["timeout"] == 30
+
+    ask("test", output_model=Person, deadline=5)
+    assert 0 < mock_post.call_args.kwargs["timeout"] <= 5
@@ -0,0 +1,120 @@
+from typing import List, Optional
+
+import torch
+from pydantic import BaseModel, Field
+
+from dariko.models.constrained import JSONCompleteStoppingCriteria, JSONSchemaLogitsProcessor, JSONSchemaMatcher
+from tests.conftest import Person
+
+
+class Team(BaseModel):
+    name: str = Field(max_length=5)
+    members: List[Person]
+    leader: Optional[Person] = None
+
+
+class CharTokenizer:
+    """1文字 = 1トークンのテスト用トークナイザ"""
+
+    def __init__(self, vocab: str):
+        self.vocab = [*vocab, "<eos>"]
+        self.eos_token_id = len(self.vocab) - 1
+        self.all_special_ids = [self.eos_token_id]
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def encode(self, text, add_special_tokens=True):
+        return [self.vocab.index(ch) for ch in text]
+
+    def decode(self, ids, skip_special_tokens=True):
+        ids = ids.tolist() if isinstance(ids, torch.Tensor) else ids
+        return "".join(self.vocab[i] for i in ids if not (skip_special_tokens and i == self.eos_token_id))
+
+
+def test_matcher_states():
+    """接頭辞・完了・不正の判定テスト"""
+    matcher = JSONSchemaMatcher(Person.model_json_schema())
+    assert matcher.state("") == "partial"
+    assert matcher.state('{"na') == "partial"
+    assert matcher.state('{"name": "test", "age": 2') == "partial"
+    assert matcher.state('{"name": "test", "age": 20, "dummy": true}\n') == "complete"
+    assert matcher.state('{"nickname"') == "invalid"
+    assert matcher.state('{"name": 1') == "invalid"
+    assert matcher.state('{"name": "test"}') == "invalid"  # required が足りない
+    assert matcher.state('{"name": "test", "age": 20, "dummy": true} x') == "invalid"
+
+
+def test_matcher_all_keys_used():
+    """宣言されたキーをすべて使った後は、カンマを許可せずに閉じるしかないこと"""
+    matcher = JSONSchemaMatcher(Person.model_json_schema())
+    prefix = '{"name": "a", "age": 1, "dummy": true'
+    assert matcher.state(prefix) == "partial"
+    assert matcher.state(prefix + ",") == "invalid"
+    assert matcher.state(prefix + ', "') == "invalid"
+    assert matcher.state(prefix + " }") == "complete"
+
+
+def test_matcher_max_properties():
+    """maxProperties に達した後はキーを追加できないこと"""
+    matcher = JSONSchemaMatcher({"type": "object", "additionalProperties": {"type": "integer"}, "maxProperties": 1})
+    assert matcher.state('{"a": 1') == "partial"
+    assert matcher.state('{"a": 1,') == "invalid"
+    assert matcher.state('{"a": 1}') == "complete"
+    assert JSONSchemaMatcher({"type": "object", "maxProperties": 0}).state('{"') == "invalid"
+
+
+def test_matcher_nested_schema():
+    """$ref / anyOf / maxLength を含むスキーマの判定テスト"""
+    matcher = JSONSchemaMatcher(Team.model_json_schema())
+    person = '{"name": "a", "age": 1, "dummy": false}'
+    assert matcher.is_complete(f'{{"name": "abc", "members": [{person}, {person}]}}')
+    assert matcher.is_complete('{"name": "abc", "members": [], "leader": null}')
+    assert matcher.is_complete(f'{{"members": [], "leader": {person}, "name": "abc"}}')
+    assert not matcher.is_valid_prefix('{"name": "abcdef')
+    assert not matcher.is_valid_prefix('{"name": "abc", "members": [,')
+
+
+def test_constrained_generation_stops_at_close():
+    """不正な続きを生成しようとしても、トップレベルの値が閉じた時点で止まること"""
+    schema = Person.model_json_schema()
+    tokenizer = CharTokenizer('{}[]":, abcdefghilmnorstuy0123456789.')
+    # モデルが出力したがる文字列（JSON の後ろに余計な説明が続く）
+    target = '{"name": "test", "age": 20, "dummy": true} this is a person.'
+    processor = JSONSchemaLogitsProcessor(tokenizer, schema, prompt_length=1, top_k=4)
+    stopping = JSONCompleteStoppingCriteria(tokenizer, schema, prompt_length=1)
+
+    input_ids = torch.tensor([[0]])
+    for step in range(len(target)):
+        scores = torch.zeros(1, len(tokenizer.vocab))
+        scores[0, tokenizer.vocab.index(target[step])] = 1.0
+        scores = processor(input_ids, scores)
+        next_id = torch.argmax(scores, dim=-1, keepdim=True)
+        input_ids = torch.cat([input_ids, next_id], dim=-1)
+        if stopping(input_ids, scores).all():
+            break
+
+    output = tokenizer.decode(input_ids[0, 1:])
+    assert output == '{"name": "test", "age": 20, "dummy": true}'
+    assert Person.model_validate_json(output).dummy is True
+
+
+def test_matcher_advance_incremental():
+    """状態を引き継いで読み進めた結果が、全体を読み直した結果と一致すること"""
+    matcher = JSONSchemaMatcher(Team.model_json_schema())
+    text = '{"name": "ab\\u00e9", "members": [{"name": "a", "age": -1, "dummy": false}], "leader": null}'
+    states = matcher.initial_states()
+    for i, ch in enumerate(text, 1):
+        states = matcher.advance(states, ch)
+        assert matcher.classify(states) == matcher.state(text[:i])
+    assert matcher.classify(states) == "complete"
+
+
+def test_processor_falls_back_outside_top_k():
+    """上位 top_k 件に候補がない場合、残りの語彙から受理できるトークンを選ぶこと"""
+    schema = Person.model_json_schema()
+    tokenizer = CharTokenizer('abc{"0')
+    processor = JSONSchemaLogitsProcessor(tokenizer, schema, prompt_length=0, top_k=2)
+    scores = torch.tensor([[5.0, 4.0, 3.0, 1.0, 2.0, 2.5, 0.0]])
+    allowed = processor(torch.tensor([[]], dtype=torch.long), scores)
+    assert torch.isfinite(allowed[0]).tolist() == [False, False, False, True, False, False, False]
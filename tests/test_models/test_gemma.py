@@ -1,10 +1,16 @@
 from unittest.mock import patch
 
+import pytest
+import torch
+from transformers import BatchEncoding
+
 from dariko import ask, set_config
-from tests.conftest import Person, mock_gemma_response
+from dariko.models.constrained import JSONCompleteStoppingCriteria, JSONSchemaLogitsProcessor
+from dariko.models.gemma import Gemma
+from tests.conftest import Person, mock_gemma_completion
 
 
-@patch("dariko.models.gemma.Gemma.call", side_effect=mock_gemma_response)
+@patch("dariko.models.gemma.Gemma.complete", side_effect=mock_gemma_completion)
 @patch("transformers.AutoTokenizer.from_pretrained")
 @patch("transformers.AutoModelForCausalLM.from_pretrained")
 def test_configure_gemma(mock_model, mock_tokenizer, mock_call):
@@ -13,3 +19,111 @@ def test_configure_gemma(mock_model, mock_tokenizer, mock_call):
     set_config(model="google/gemma-2b", llm_key="test_hf_token")
     result: Person = ask("test", output_model=Person)
     assert result.dummy is True 
+
+
+@patch("dariko.models.gemma._cpu_supports_bf16", return_value=True)
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_cpu_profile(mock_model, mock_tokenizer, mock_bf16):
+    """CPUプロファイルの dtype 選択とウォームアップのテスト"""
+    llm = Gemma("google/gemma-2b", "test_hf_token", profile="cpu")
+    assert mock_model.call_args.kwargs["torch_dtype"] is torch.bfloat16
+    assert "device_map" not in mock_model.call_args.kwargs
+    # ロード時に一度だけウォームアップされる
+    assert llm.model.generate.call_count == 1
+
+
+@patch("torch.ao.quantization.quantize_dynamic")
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_cpu_profile_quantize(mock_model, mock_tokenizer, mock_quantize):
+    """動的 int8 量子化は fp32 で読み込んでから適用されること"""
+    llm = Gemma("google/gemma-2b", "test_hf_token", profile="cpu", quantize=True)
+    assert mock_model.call_args.kwargs["torch_dtype"] is torch.float32
+    assert mock_quantize.call_args.kwargs["dtype"] is torch.qint8
+    assert llm.model is mock_quantize.return_value
+
+
+def test_quantize_requires_cpu_profile():
+    """CPUプロファイル以外で量子化を指定した場合のテスト"""
+    with pytest.raises(ValueError, match="quantize"):
+        Gemma("google/gemma-2b", "test_hf_token", quantize=True)
+
+
+@patch("dariko.models.gemma.Gemma.complete", side_effect=mock_gemma_completion)
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_model_loaded_once(mock_model, mock_tokenizer, mock_call):
+    """同じ設定ではモデルが一度だけロードされること"""
+    set_config(model="google/gemma-2b", llm_key="test_hf_token", profile="cpu")
+    ask("test", output_model=Person)
+    ask("test", output_model=Person)
+    assert mock_model.call_count == 1
+
+
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_call_passes_constraints(mock_model, mock_tokenizer):
+    """制約付き生成の LogitsProcessor と StoppingCriteria が generate に渡されること"""
+    llm = Gemma("google/gemma-2b", "test_hf_token")
+    llm.tokenizer.return_value = BatchEncoding({"input_ids": torch.tensor([[1, 2, 3]])})
+    llm.tokenizer.decode.return_value = '{"name": "test", "age": 20, "dummy": true}'
+    llm.model.device = "cpu"
+    llm.model.generate.return_value = torch.tensor([[1, 2, 3, 4, 5]])
+
+    schema = Person.model_json_schema()
+    completion = llm.complete([{"role": "user", "content": "test"}], schema=schema, max_tokens=64, timeout=5)
+
+    kwargs = llm.model.generate.call_args.kwargs
+    assert kwargs["max_new_tokens"] == 64
+    assert kwargs["max_time"] == 5
+    (processor,) = kwargs["logits_processor"]
+    (stopping,) = kwargs["stopping_criteria"]
+    assert isinstance(processor, JSONSchemaLogitsProcessor)
+    assert isinstance(stopping, JSONCompleteStoppingCriteria)
+    assert processor.matcher.schema is schema
+    # トークンの文字列キャッシュはモデルと共有される
+    assert processor.token_texts is llm._token_texts
+    # プロンプト部分を除いた生成トークンだけがデコードされる
+    assert llm.tokenizer.decode.call_args.args[0].tolist() == [4, 5]
+    assert Person.model_validate_json(completion.text).dummy is True
+    assert completion.truncated is False
+    assert completion.output_tokens == 2
+
+    # 生成トークン数が上限に達した場合は打ち切りとして報告される
+    assert llm.complete([{"role": "user", "content": "test"}], schema=schema, max_tokens=2).truncated is True
+
+
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_call_unconstrained(mock_model, mock_tokenizer):
+    """constrained=False の場合は生成に制約が渡されないこと"""
+    llm = Gemma("google/gemma-2b", "test_hf_token", constrained=False)
+    llm.tokenizer.return_value = BatchEncoding({"input_ids": torch.tensor([[1, 2, 3]])})
+    llm.model.device = "cpu"
+    llm.model.generate.return_value = torch.tensor([[1, 2, 3, 4]])
+
+    llm.call([{"role": "user", "content": "test"}], schema=Person.model_json_schema())
+
+    kwargs = llm.model.generate.call_args.kwargs
+    assert "logits_processor" not in kwargs
+    assert "stopping_criteria" not in kwargs
+
+
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_public_checkpoint_without_token(mock_model, mock_tokenizer):
+    """公開チェックポイントはトークンなしで読み込めること"""
+    Gemma("hf-internal-testing/tiny-random-GemmaForCausalLM")
+    assert mock_tokenizer.call_args.kwargs["token"] is None
+    assert mock_model.call_args.kwargs["token"] is None
+
+
+@patch("transformers.AutoTokenizer.from_pretrained")
+@patch("transformers.AutoModelForCausalLM.from_pretrained")
+def test_dtype_override(mock_model, mock_tokenizer):
+    """dtype を指定した場合はプロファイルの既定値より優先されること"""
+    Gemma("google/gemma-2b", dtype=torch.float32)
+    assert mock_model.call_args.kwargs["torch_dtype"] is torch.float32
+    with pytest.raises(ValueError, match="float32"):
+        Gemma("google/gemma-2b", profile="cpu", quantize=True, dtype=torch.bfloat16)
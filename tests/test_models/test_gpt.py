@@ -4,6 +4,7 @@ from unittest.mock import patch
 import pytest
 
 from dariko import ask, set_config
+from dariko.models.gpt import GPT
 from tests.conftest import Person, mock_gpt_response
 
 
@@ -20,4 +21,18 @@ def test_configure_gpt(mock_post):
     os.environ["DARIKO_API_KEY"] = "direct_key"
     set_config(model="gpt-4o-mini", llm_key="direct_key")
     result: Person = ask("test", output_model=Person)
-    assert result.dummy is True 
+    assert result.dummy is True
+
+
+@patch("dariko.models.gpt.requests.post")
+def test_truncation_reported(mock_post):
+    """finish_reason と usage から打ち切りと出力トークン数が返されること"""
+    response = mock_gpt_response()
+    response._json["choices"][0]["finish_reason"] = "length"
+    response._json["usage"] = {"completion_tokens": 8}
+    mock_post.return_value = response
+
+    completion = GPT("gpt-4o-mini", "test_key").complete([{"role": "user", "content": "test"}], max_tokens=8)
+    assert completion.truncated is True
+    assert completion.output_tokens == 8
+    assert mock_post.call_args.kwargs["json"]["max_completion_tokens"] == 8
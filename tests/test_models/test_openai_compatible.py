@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from dariko import DeadlineExceededError, ask, ask_batch, set_config
+from dariko.driver import _get_llm_instance
+from dariko.models.openai_compatible import OpenAICompatible
+from tests.conftest import Person
+
+CONTENT = '{"name": "test", "age": 20, "dummy": true}'
+NON_ASCII_CONTENT = '{"name": "山田太郎", "age": 25, "dummy": false}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI 互換の /v1/chat/completions だけを持つスタブサーバー"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        stall = len(self.server.requests) > self.server.stall_after_requests
+        if not body.get("stream"):
+            choice = {"message": {"content": CONTENT}, "finish_reason": self.server.finish_reason}
+            data = json.dumps({"choices": [choice], "usage": {"completion_tokens": 12}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        content = self.server.content
+        for i in range(0, len(content), 8):
+            chunk = {"choices": [{"delta": {"content": content[i : i + 8]}}]}
+            # 非 ASCII 文字をエスケープせずに UTF-8 で送る（charset は指定しない）
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+            if stall:
+                # 最初のチャンクを送った後に応答を止める
+                self.server.release.wait(timeout=5)
+                return
+        chunk = {"choices": [{"delta": {}, "finish_reason": self.server.finish_reason}]}
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.requests = []
+    httpd.chunk_delay = 0
+    httpd.finish_reason = "stop"
+    httpd.content = CONTENT
+    httpd.stall_after_requests = float("inf")
+    httpd.release = threading.Event()
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def test_routing_by_base_url(server):
+    """base_url を指定した場合はモデル名に関わらず OpenAI 互換 API に振り分けられること"""
+    set_config(model="gpt-oss-20b", base_url=base_url(server))
+    assert isinstance(_get_llm_instance(), OpenAICompatible)
+
+
+def test_ask(server):
+    """構造化出力の指定がサーバーに渡されること"""
+    set_config(model="meta-llama/Llama-3-8B", base_url=base_url(server))
+    result: Person = ask("test", output_model=Person)
+    assert result.dummy is True
+
+    path, body = server.requests[-1]
+    assert path == "/v1/chat/completions"
+    assert body["model"] == "meta-llama/Llama-3-8B"
+    assert body["response_format"]["json_schema"]["schema"] == Person.model_json_schema()
+    # 長さ制約のない出力モデルでは上限を送らず、サーバーの既定値を使う
+    assert "max_tokens" not in body
+
+
+def test_guided_json(server):
+    """vLLM の guided_json を使う場合のテスト"""
+    set_config(model="meta-llama/Llama-3-8B", base_url=base_url(server), structured_output="guided_json")
+    ask("test", output_model=Person)
+    _, body = server.requests[-1]
+    assert body["guided_json"] == Person.model_json_schema()
+    assert "response_format" not in body
+
+
+def test_stream(server):
+    """ストリーミングで受け取った差分が連結されること"""
+    set_config(model="meta-llama/Llama-3-8B", base_url=base_url(server), stream=True)
+    results = ask_batch(["test1", "test2"], output_model=Person)
+    assert all(r.dummy is True for r in results)
+    assert all(body["stream"] is True for _, body in server.requests)
+
+    llm = OpenAICompatible("meta-llama/Llama-3-8B", base_url=base_url(server))
+    assert "".join(llm.stream([{"role": "user", "content": "test"}])) == CONTENT
+
+
+def test_stream_deadline(server):
+    """ストリーミング受信中も締め切りが確認されること"""
+    server.chunk_delay = 0.05
+    set_config(model="meta-llama/Llama-3-8B", base_url=base_url(server), stream=True)
+    with pytest.raises(DeadlineExceededError):
+        ask("test", output_model=Person, deadline=0.1)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_truncation_reported(server, stream):
+    """finish_reason が length の場合は打ち切りとして報告されること"""
+    llm = OpenAICompatible("meta-llama/Llama-3-8B", base_url=base_url(server), stream=stream)
+    messages = [{"role": "user", "content": "test"}]
+    assert llm.complete(messages).truncated is False
+
+    server.finish_reason = "length"
+    completion = llm.complete(messages, max_tokens=12)
+    assert completion.truncated is True
+    assert completion.text == CONTENT
+    assert completion.output_tokens == (None if stream else 12)
+
+
+def test_stream_utf8_without_charset(server):
+    """charset のない text/event-stream でも非 ASCII 文字が UTF-8 として復号されること"""
+    server.content = NON_ASCII_CONTENT
+    set_config(model="meta-llama/Llama-3-8B", base_url=base_url(server), stream=True)
+    result: Person = ask("test", output_model=Person)
+    assert result.name == "山田太郎"
+
+    llm = OpenAICompatible("meta-llama/Llama-3-8B", base_url=base_url(server))
+    assert "".join(llm.stream([{"role": "user", "content": "test"}])) == NON_ASCII_CONTENT
+
+
+def test_stream_stalled_server(server):
+    """ストリーミングの途中でサーバーが止まっても締め切りで打ち切られ、完了した結果は返されること"""
+    server.stall_after_requests = 1
+    set_config(model="meta-llama/Llama-3-8B", base_url=base_url(server), stream=True)
+    start = time.monotonic()
+    results = ask_batch(["test1", "test2"], output_model=Person, deadline=0.5)
+    elapsed = time.monotonic() - start
+
+    assert results[0].dummy is True
+    assert results[1] is None
+    assert elapsed < 1.0